@@ -0,0 +1,79 @@
+"""
+Benchmarks the YouTube results page parser against the old
+first-'watch?v' scan, using HTML fixtures so it runs offline.
+
+Usage:
+    python -m benchmarks.search_parser [iterations]
+    python -m benchmarks.search_parser --record "<query>"
+
+--record saves a live results page to benchmarks/fixtures/
+so the parser can be checked against the current layout.
+
+The bundled synthetic_youtube_search.html is hand-written (about
+10 KiB) to exercise the parser's edge cases: an ad slot, a shorts shelf and a
+decoy watch?v before the results. Real results pages are several
+hundred KiB of ytInitialData, so timings against it say little
+about production cost. Record a real page before comparing numbers.
+"""
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+import glob
+import os
+import re
+import sys
+import timeit
+
+from cogs.music.classes.search import SEARCH_URL, parse_results
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def legacy_scan(html: str) -> str:
+    """The character loop fetch_track used before the parser"""
+    src = "https://www.youtube.com/"
+    for i in range(html.find("watch?v"), len(html)):
+        if html[i] == '"':
+            break
+        src += html[i]
+    return src
+
+def record(query: str) -> None:
+    request = Request(
+        SEARCH_URL + urlencode({"search_query": query}),
+        headers={"Accept-Language": "en-US,en;q=0.9", "User-Agent": "Mozilla/5.0"}
+    )
+
+    with urlopen(request) as response:
+        html = response.read().decode("utf-8")
+
+    name = re.sub(r"\W+", "_", query.lower()).strip("_")
+    path = os.path.join(FIXTURES, f"{name}.html")
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+    print(f"Recorded {len(html) / 1024:.0f} KiB to {path}")
+
+def main() -> None:
+    if len(sys.argv) > 2 and sys.argv[1] == "--record":
+        record(sys.argv[2])
+        return
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.html"))):
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+
+        results = parse_results(html)
+        legacy = timeit.timeit(lambda: legacy_scan(html), number=iterations) / iterations
+        parser = timeit.timeit(lambda: parse_results(html), number=iterations) / iterations
+
+        print(f"{os.path.basename(path)} ({len(html) / 1024:.0f} KiB)")
+        print(f"  legacy scan : {legacy * 1000:8.3f} ms -> {legacy_scan(html)}")
+        print(f"  parser      : {parser * 1000:8.3f} ms -> {len(results)} candidates")
+
+        for result in results:
+            print(f"    {result.id}  {result.duration:>5}s  {result.channel} - {result.title}")
+
+if __name__ == "__main__":
+    main()
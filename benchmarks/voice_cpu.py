@@ -0,0 +1,91 @@
+"""
+Compares the CPU cost of one voice stream in PCM and Opus
+passthrough mode.
+
+Usage:
+    python -m benchmarks.voice_cpu <audio url or file> [seconds]
+
+Every mode reads the same number of 20ms frames as fast as
+possible and reports CPU seconds spent per second of audio,
+split between this process (volume scaling and Opus encoding)
+and the ffmpeg child process.
+"""
+import resource
+import sys
+import time
+
+import discord
+from discord.opus import Encoder
+
+FFMPEG_OPTS = {
+    "before_options": "-nostdin",
+    "options": "-vn -loglevel quiet -hide_banner -nostats"
+}
+
+def child_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def measure(name: str, source: discord.AudioSource, frames: int, encoder: Encoder = None) -> None:
+    own_start = time.process_time()
+    child_start = child_cpu()
+
+    read = 0
+    while read < frames:
+        data = source.read()
+        if not data:
+            break
+
+        if encoder:
+            encoder.encode(data, Encoder.SAMPLES_PER_FRAME)
+
+        read += 1
+
+    own = time.process_time() - own_start
+    # Child usage is only accounted once ffmpeg has exited
+    source.cleanup()
+    child = child_cpu() - child_start
+
+    seconds = read * Encoder.FRAME_LENGTH / 1000
+    if not seconds:
+        print(f"{name:<24} no audio read")
+        return
+
+    print(
+        f"{name:<24} {seconds:>6.1f}s audio  "
+        f"python {own / seconds * 100:>6.2f}%  "
+        f"ffmpeg {child / seconds * 100:>6.2f}%  "
+        f"total {(own + child) / seconds * 100:>6.2f}% of a core"
+    )
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    url = sys.argv[1]
+    frames = int(float(sys.argv[2]) * 1000 / Encoder.FRAME_LENGTH) if len(sys.argv) > 2 else 1500
+
+    measure(
+        "pcm + volume + encode",
+        discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(url, **FFMPEG_OPTS), volume=0.5),
+        frames,
+        Encoder()
+    )
+    measure(
+        "opus passthrough (copy)",
+        discord.FFmpegOpusAudio(url, codec="opus", **FFMPEG_OPTS),
+        frames
+    )
+    measure(
+        "opus passthrough (filter)",
+        discord.FFmpegOpusAudio(
+            url,
+            before_options=FFMPEG_OPTS["before_options"],
+            options=f"{FFMPEG_OPTS['options']} -filter:a volume=0.5"
+        ),
+        frames
+    )
+
+if __name__ == "__main__":
+    main()
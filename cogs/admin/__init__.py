@@ -1,4 +1,8 @@
 from .admin import Admin
 
+# Prefix commands need message content
+INTENTS = ("guild_messages", "message_content")
+MEMBER_CACHE = ()
+
 async def setup(client):
     await client.add_cog(Admin(client))
@@ -1,10 +1,18 @@
 import discord
 import logging
 from discord.ext import commands
+from typing import Any, Dict, Optional
 
 from core.bot import YaeMiko
 from core.colors import *
 
+# Access level each command requires in a guild
+levels = {
+    "setaccess": 2,
+    "restart": 5,
+    "sync": 5
+}
+
 class Admin(commands.Cog):
     def __init__(self, client: YaeMiko) -> None:
         self.client = client
@@ -17,6 +25,8 @@ class Admin(commands.Cog):
         self.client.configure_logger()
         self.logger = logging.getLogger("yaemiko.admin")
 
+        self.client.add_ipc_handler("sync", self.on_ipc_sync)
+
     # async def validate(self, message: discord.Message) -> None:
     #     """Validates messages if 'yaechannel' is set"""
     #     # Checking for validity of the command
@@ -40,19 +50,19 @@ class Admin(commands.Cog):
     #         ctx, f"Invalid command: '{message.content}'.\n\n**Invalid commands will be deleted in this channel.**"
     #     )
 
-    # async def has_access(self, ctx: commands.Context, level: int) -> bool:
-    #     """Check if a user has required access level"""
-    #     flag: bool = True if Database(ctx.guild.id).get_access(ctx.author.id) >= level else False
+    async def has_access(self, ctx: commands.Context, level: int) -> bool:
+        """Check if a user has required access level"""
+        flag: bool = await self.client.access.has_access(ctx.guild.id, ctx.author.id, level)
 
-    #     if not flag:
-    #         await ctx.send(
-    #             embed=discord.Embed(
-    #                 colour=red,
-    #                 description=f"You must have at least access level **{level}** to use this command."
-    #             )
-    #         )
+        if not flag:
+            await ctx.send(
+                embed=discord.Embed(
+                    colour=red,
+                    description=f"You must have at least access level **{level}** to use this command."
+                )
+            )
 
-    #     return flag
+        return flag
 
     # @commands.Cog.listener()
     # async def on_message(self, message: discord.Message) -> None:
@@ -106,63 +116,73 @@ class Admin(commands.Cog):
     #         )
     #         self.client.logger.debug(f"Enabled command checking in channel: {ctx.channel.id} for guild: {ctx.guild.id}")
 
-    # @commands.command(aliases=["sa"])
-    # async def setaccess(self, ctx: commands.Context, member: discord.Member, access: int = 0) -> None:
-    #     """Modify access level of specified user"""
-    #     db = Database(ctx.guild.id)
+    @commands.command(aliases=["sa"])
+    @commands.guild_only()
+    async def setaccess(self, ctx: commands.Context, member: discord.Member, access: int = 0) -> None:
+        """Modify access level of specified user"""
+        if not await self.has_access(ctx, levels['setaccess']):
+            return
+
+        levels = await self.client.access.get_many(ctx.guild.id, (ctx.author.id, member.id))
+
+        if levels[member.id] >= levels[ctx.author.id] or ctx.author == member:
+            await ctx.send(
+                embed=discord.Embed(
+                    colour=red,
+                    description="You cannot change the access level for this user."
+                )
+            )
+            return
+
+        # Nobody can grant a level equal to or above their own
+        if access < 0 or access >= levels[ctx.author.id]:
+            await ctx.send(
+                embed=discord.Embed(
+                    colour=red,
+                    description=f"Access level must be between **0** and **{levels[ctx.author.id] - 1}**."
+                )
+            )
+            return
 
-    #     if db.compare_access(ctx.author.id, member.id) == member.id or ctx.author == member:
-    #         await ctx.send(
-    #             embed=discord.Embed(
-    #                 colour=red,
-    #                 description="You cannot change the access level for this user."
-    #             )
-    #         )
-    #         return
-        
-    #     if access == 0:
-    #         db.delete_user(member.id)
-    #         await ctx.send(
-    #             embed=discord.Embed(
-    #                 colour=pink,
-    #                 description=f"Removed access for {member.nick if member.nick else member.name}."
-    #             )
-    #         )
-    #         self.client.logger.debug(f"Removed access for user: {member.id} in guild: {ctx.guild.id}")
-    #         return
-            
-    #     db.update(member.id, access)
-    #     await ctx.send(
-    #         embed=discord.Embed(
-    #             colour=pink,
-    #             description=f"Set **{member.nick if member.nick else member.name}'s** access to {access}"
-    #         )
-    #     )
+        await self.client.access.set_access(ctx.guild.id, member.id, access)
 
-    # @commands.command()
-    # async def sudo(self, ctx: commands.Context) -> None:
-    #     """Gives bot owner highest access level (for debugging)"""
-    #     if ctx.author.id != 200034086444597248:
-    #         await ctx.send(
-    #             embed=discord.Embed(
-    #                 colour=red,
-    #                 description="Only the bot owner is authorized to use this command."
-    #             )
-    #         )
-    #         return
+        if access == 0:
+            await ctx.send(
+                embed=discord.Embed(
+                    colour=pink,
+                    description=f"Removed access for {member.nick if member.nick else member.name}."
+                )
+            )
+            self.client.logger.debug(f"Removed access for user: {member.id} in guild: {ctx.guild.id}")
+            return
 
-    #     db = Database(ctx.guild.id)
-    #     db.update(200034086444597248, 5)
+        await ctx.send(
+            embed=discord.Embed(
+                colour=pink,
+                description=f"Set **{member.nick if member.nick else member.name}'s** access to {access}"
+            )
+        )
 
-    #     await ctx.send(
-    #         embed=discord.Embed(
-    #             colour=pink,
-    #             description="You have been given the maximum access level."
-    #         )
-    #     )
+    @commands.command()
+    @commands.guild_only()
+    @commands.is_owner()
+    async def sudo(self, ctx: commands.Context) -> None:
+        """Gives bot owner highest access level (for debugging)"""
+        await self.client.access.set_access(ctx.guild.id, ctx.author.id, 5)
+
+        await ctx.send(
+            embed=discord.Embed(
+                colour=pink,
+                description="You have been given the maximum access level."
+            )
+        )
 
     @commands.command(aliases=["r"])
-    async def restart(self, ctx: commands.Context) -> None:
+    @commands.guild_only()
+    async def restart(self, ctx: commands.Context, cluster: Optional[int] = None) -> None:
+        if not await self.has_access(ctx, levels['restart']):
+            return
+
         await ctx.send(
             embed=discord.Embed(
                 colour=pink,
@@ -170,6 +190,11 @@ class Admin(commands.Cog):
             )
         )
 
+        # Clustered, the launcher closes and starts the clusters again
+        if self.client.ipc:
+            self.client.ipc.restart(cluster)
+            return
+
         await self.client.close()
 
     @commands.command()
@@ -178,20 +203,39 @@ class Admin(commands.Cog):
         await ctx.message.delete()
         await ctx.send(message)
 
+    def prepare_sync(self, clear: bool, do_global: bool) -> None:
+        """Apply the tree changes that come before a sync"""
+        guild = self.client.test_guild
+
+        if clear:
+            self.client.tree.clear_commands(guild=None if do_global else guild)
+
+        if not do_global and not clear:
+            self.client.tree.copy_global_to(guild=guild)
+
+    async def on_ipc_sync(self, message: Dict[str, Any]) -> None:
+        """Mirrors a sync issued in another cluster, the command list was already sent to Discord"""
+        self.prepare_sync(message.get("clear", False), message.get("do_global", False))
+        self.logger.debug(f"Applied sync from cluster {message.get('origin')}")
+
     @commands.command()
+    @commands.guild_only()
     async def sync(self, ctx: commands.Context, *, args: str = " ") -> None:
+        if not await self.has_access(ctx, levels['sync']):
+            return
+
         params = args.split()
 
         clear = '-c' in params
         do_global = '-g' in params
 
-        guild = self.client.test_guild
+        self.prepare_sync(clear, do_global)
 
-        if clear:
-            ctx.bot.tree.clear_commands(guild=None if do_global else guild)
+        # Every cluster keeps its own command tree, so the others apply the same changes
+        if self.client.ipc:
+            self.client.ipc.broadcast("sync", clear=clear, do_global=do_global)
 
-        if not do_global and not clear:
-            ctx.bot.tree.copy_global_to(guild=guild)
+        guild = self.client.test_guild
 
         try:
             self.logger.debug("Sync started")
@@ -1,5 +1,8 @@
 from discord.ext.commands import Bot
 from .commands.mh_account import MonaHeistAccount
 
+INTENTS = ()
+MEMBER_CACHE = ()
+
 async def setup(client: Bot):
     await client.add_cog(MonaHeistAccount(client))
@@ -1,4 +1,7 @@
 from .info import Info
 
+INTENTS = ("guild_messages", "message_content")
+MEMBER_CACHE = ()
+
 async def setup(client):
     await client.add_cog(Info(client))
@@ -35,4 +35,10 @@ class Info(commands.Cog):
             value=self.client.version.get("license")
         )
 
+        memory = self.client.memory_report
+        embed.add_field(
+            name="Memory",
+            value=f"{memory['rss'] / 2 ** 20:.1f} MiB (~{memory['per_guild'] / 1024:.1f} KiB per guild)"
+        )
+
         await ctx.send(embed=embed)
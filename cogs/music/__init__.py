@@ -1,5 +1,9 @@
 from .commands import MusicCommands
 
+# Voice members are cached from voice states for the auto-disconnect check
+INTENTS = ("guild_messages", "message_content", "voice_states")
+MEMBER_CACHE = ("voice",)
+
 async def setup(client) -> None:
     """Adds the cog to the client"""
     await client.add_cog(MusicCommands(client))
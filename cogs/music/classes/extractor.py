@@ -0,0 +1,158 @@
+"""
+This file contains the Extractor class which runs yt-dlp
+extraction jobs on a dedicated pool of long-lived workers.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import logging
+import multiprocessing
+import threading
+
+import yt_dlp
+
+# Fields kept from yt-dlp info dicts, everything else is dropped in the worker
+INFO_FIELDS = ("id", "title", "uploader", "url", "thumbnail", "duration", "acodec")
+# Fields kept from flat playlist entries, enough to queue a track without resolving it
+ENTRY_FIELDS = ("id", "title", "uploader", "channel", "duration")
+
+# Each worker thread (or process) keeps its own YoutubeDL instance
+_worker = threading.local()
+
+def _init_worker(options: Dict[str, Any]) -> None:
+    """Builds the YoutubeDL instance owned by a worker"""
+    _worker.ytdl = yt_dlp.YoutubeDL(options)
+    # Flat extraction lists playlist entries without resolving any of them
+    _worker.flat = yt_dlp.YoutubeDL({**options, "noplaylist": False, "extract_flat": "in_playlist"})
+
+def _extract(url: str) -> Optional[Dict[str, Any]]:
+    """Runs extraction inside a worker and trims the result"""
+    data = _worker.ytdl.extract_info(url, download=False)
+
+    if not data:
+        return None
+
+    return {field: data.get(field) for field in INFO_FIELDS}
+
+def _extract_playlist(url: str, start: int, end: int) -> Optional[Dict[str, Any]]:
+    """Lists one page of a playlist inside a worker"""
+    # The instance belongs to this worker, so the page range can be set in place
+    _worker.flat.params["playliststart"] = start
+    _worker.flat.params["playlistend"] = end
+
+    data = _worker.flat.extract_info(url, download=False)
+
+    if not data:
+        return None
+
+    return {
+        "title": data.get("title"),
+        "entries": [
+            {field: entry.get(field) for field in ENTRY_FIELDS}
+            for entry in data.get("entries") or [] if entry and entry.get("id")
+        ]
+    }
+
+class ExtractorBusy(Exception):
+    """Raised when the extraction queue is full"""
+    pass
+
+class Extractor:
+    def __init__(
+        self,
+        options: Dict[str, Any],
+        workers: int = 4,
+        mode: str = "thread",
+        max_pending: int = 32,
+        timeout: float = 30
+    ) -> None:
+        self.__max_pending : int            = max_pending
+        self.__timeout     : float          = timeout
+        self.__pending     : int            = 0
+        self.__logger      : logging.Logger = logging.getLogger("yaemiko.music.extractor")
+        self.completed     : int            = 0
+        self.timeouts      : int            = 0
+        self.rejected      : int            = 0
+
+        if mode == "process":
+            # Forking a process with a running event loop is unsafe
+            self.__executor: Executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(options,)
+            )
+        else:
+            self.__executor: Executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix="ytdl",
+                initializer=_init_worker,
+                initargs=(options,)
+            )
+
+        self.logger.debug(f"Started extractor ({mode} pool, {workers} workers)")
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    @property
+    def pending(self) -> int:
+        """Returns the number of jobs waiting for or running on a worker"""
+        return self.__pending
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Returns extractor counters"""
+        return {
+            "pending": self.pending,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected
+        }
+
+    async def extract(self, url: str) -> Optional[Dict[str, Any]]:
+        """Extract stream information for a URL"""
+        return await self.__submit(_extract, url)
+
+    async def extract_playlist(self, url: str, start: int, end: int) -> Optional[Dict[str, Any]]:
+        """List entries start to end (1-based, inclusive) of a playlist"""
+        return await self.__submit(_extract_playlist, url, start, end)
+
+    async def __submit(self, func: Callable, url: str, *args) -> Optional[Dict[str, Any]]:
+        if self.__pending >= self.__max_pending:
+            self.rejected += 1
+            raise ExtractorBusy(f"{self.__pending} extraction jobs already pending")
+
+        loop = asyncio.get_running_loop()
+        job = self.__executor.submit(func, url, *args)
+        self.__pending += 1
+
+        # A timed out job keeps its worker busy, the slot is freed once it really ends
+        job.add_done_callback(lambda _: self.__release(loop))
+
+        try:
+            data = await asyncio.wait_for(asyncio.wrap_future(job), self.__timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.logger.debug(f"Extraction timed out after {self.__timeout}s: '{url}'")
+            return None
+
+        self.completed += 1
+        return data
+
+    def __release(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Called from the worker once a job ends, decrements on the loop"""
+        def release() -> None:
+            self.__pending -= 1
+
+        try:
+            loop.call_soon_threadsafe(release)
+        except RuntimeError:
+            # The loop is already closed, nobody reads the count anymore
+            pass
+
+    def close(self) -> None:
+        """Shut down the worker pool"""
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+        self.logger.debug("Stopped extractor")
@@ -0,0 +1,198 @@
+"""
+This file contains the FavoritesStore class which keeps every
+user's liked songs in one indexed sqlite database.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+import asyncio
+import glob
+import logging
+import os
+import sqlite3
+import time
+
+from .song import Song
+
+@dataclass(frozen=True)
+class Favorite:
+    seq: int
+    video_id: Optional[str]
+    title: str
+    author: str
+    url: str
+    thumbnail: str
+    duration: int
+
+    def __str__(self) -> str:
+        return self.title
+
+    @property
+    def query(self) -> str:
+        """Returns what to resolve to replay the song, a URL when known"""
+        return self.url if self.video_id else self.title
+
+class FavoritesStore:
+    def __init__(self, path: str = "data/favorites.db") -> None:
+        self.__path     : str                = path
+        self.__conn     : sqlite3.Connection = None
+        self.__logger   : logging.Logger     = logging.getLogger("yaemiko.music")
+        # One thread owns the connection, which also serialises writes
+        self.__executor : ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="favorites")
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    async def __run(self, func: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__conn:
+            return self.__conn
+
+        self.__conn = sqlite3.connect(self.__path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+
+        with self.__conn:
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS favorites ("
+                "user_id INTEGER NOT NULL, seq INTEGER NOT NULL, video_id TEXT, title TEXT NOT NULL, "
+                "author TEXT, url TEXT, thumbnail TEXT, duration INTEGER, added_at REAL, "
+                "PRIMARY KEY (user_id, seq)) WITHOUT ROWID"
+            )
+
+        return self.__conn
+
+    # Public API, every call runs on the store thread
+    async def add(self, user_id: int, song: Song) -> int:
+        """Append a song to a user's favorites, returns its number"""
+        return await self.__run(self.__add, user_id, song)
+
+    async def remove(self, user_id: int, seq: int) -> Optional[Favorite]:
+        """Remove the favorite with the given number"""
+        return await self.__run(self.__remove, user_id, seq)
+
+    async def get(self, user_id: int, seq: int) -> Optional[Favorite]:
+        """Returns the favorite with the given number"""
+        return await self.__run(self.__get, user_id, seq)
+
+    async def page(self, user_id: int, page: int, per_page: int = 10) -> Tuple[List[Favorite], int]:
+        """Returns one page of favorites and the total count"""
+        return await self.__run(self.__page, user_id, page, per_page)
+
+    async def all(self, user_id: int) -> List[Favorite]:
+        return await self.__run(self.__select, user_id, -1, 0)
+
+    async def resolve(self, user_id: int, seq: int, song: Song) -> None:
+        """Store the video a title-only favorite resolved to"""
+        await self.__run(self.__resolve, user_id, seq, song)
+
+    async def migrate(self, folder: str = "playlists") -> int:
+        """Imports legacy playlists/<user>.txt files once, returns the number imported"""
+        return await self.__run(self.__migrate, folder)
+
+    def close(self) -> None:
+        # Runs after the queued jobs on the store thread, without blocking the event loop
+        self.__executor.submit(self.__close)
+        self.__executor.shutdown(wait=False)
+
+    # Store thread
+    def __add(self, user_id: int, song: Song) -> int:
+        conn = self.__connect()
+
+        with conn:
+            # MAX over the primary key is a single index seek
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM favorites WHERE user_id=?", (user_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO favorites VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, seq, song.video_id, song.title, song.author, song.url, song.thumbnail, song.duration, time.time())
+            )
+
+        return seq
+
+    def __get(self, user_id: int, seq: int) -> Optional[Favorite]:
+        row = self.__connect().execute(
+            "SELECT seq, video_id, title, author, url, thumbnail, duration FROM favorites "
+            "WHERE user_id=? AND seq=?",
+            (user_id, seq)
+        ).fetchone()
+
+        return Favorite(*row) if row else None
+
+    def __remove(self, user_id: int, seq: int) -> Optional[Favorite]:
+        favorite = self.__get(user_id, seq)
+
+        if not favorite:
+            return None
+
+        with self.__conn:
+            self.__conn.execute("DELETE FROM favorites WHERE user_id=? AND seq=?", (user_id, seq))
+
+        return favorite
+
+    def __select(self, user_id: int, limit: int, offset: int) -> List[Favorite]:
+        if offset < 0:
+            return []
+
+        rows = self.__connect().execute(
+            "SELECT seq, video_id, title, author, url, thumbnail, duration FROM favorites "
+            "WHERE user_id=? ORDER BY seq LIMIT ? OFFSET ?",
+            (user_id, limit, offset)
+        ).fetchall()
+
+        return [Favorite(*row) for row in rows]
+
+    def __page(self, user_id: int, page: int, per_page: int) -> Tuple[List[Favorite], int]:
+        total = self.__connect().execute(
+            "SELECT COUNT(*) FROM favorites WHERE user_id=?", (user_id,)
+        ).fetchone()[0]
+
+        return self.__select(user_id, per_page, page * per_page), total
+
+    def __resolve(self, user_id: int, seq: int, song: Song) -> None:
+        with self.__connect():
+            self.__conn.execute(
+                "UPDATE favorites SET video_id=?, title=?, author=?, url=?, thumbnail=?, duration=? "
+                "WHERE user_id=? AND seq=?",
+                (song.video_id, song.title, song.author, song.url, song.thumbnail, song.duration, user_id, seq)
+            )
+
+    def __migrate(self, folder: str) -> int:
+        conn = self.__connect()
+        imported = 0
+
+        for path in glob.glob(os.path.join(folder, "*.txt")):
+            name = os.path.splitext(os.path.basename(path))[0]
+
+            if not name.isdigit():
+                continue
+
+            with open(path, 'r', encoding="utf8") as file:
+                titles = [title for title in file.read().splitlines() if title.strip()]
+
+            with conn:
+                start = conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) FROM favorites WHERE user_id=?", (int(name),)
+                ).fetchone()[0]
+                # Titles only, the video is looked up on first replay and stored
+                conn.executemany(
+                    "INSERT INTO favorites (user_id, seq, title, added_at) VALUES (?, ?, ?, ?)",
+                    [(int(name), start + i, title, time.time()) for i, title in enumerate(titles, start=1)]
+                )
+
+            os.replace(path, f"{path}.migrated")
+            imported += len(titles)
+
+        if imported:
+            self.logger.info(f"Migrated {imported} favorites from {folder}/")
+
+        return imported
+
+    def __close(self) -> None:
+        if self.__conn:
+            self.__conn.close()
+            self.__conn = None
@@ -0,0 +1,143 @@
+"""
+This file contains the Governor class which caps how many
+voice streams and ffmpeg processes one node runs at a time.
+"""
+from typing import Any, Dict, Set
+import asyncio
+import logging
+import time
+
+# Seconds for the encode lag average to halve once no frames report it,
+# counted after a grace period so the 20ms gap between frames does not decay it
+LAG_HALF_LIFE = 1.0
+LAG_GRACE = 0.1
+
+class CapacityExceeded(Exception):
+    """Raised when the node cannot take another stream"""
+    pass
+
+class Governor:
+    def __init__(
+        self,
+        max_streams: int = 50,
+        max_processes: int = 60,
+        max_encode_lag: float = 15,
+        queue_timeout: float = 10
+    ) -> None:
+        self.__max_streams    : int            = max_streams
+        self.__max_processes  : int            = max_processes
+        self.__max_encode_lag : float          = max_encode_lag / 1000
+        self.__queue_timeout  : float          = queue_timeout
+        self.__streams        : Set[int]       = set()
+        self.__processes      : int            = 0
+        self.__released      : asyncio.Event  = asyncio.Event()
+        self.__logger         : logging.Logger = logging.getLogger("yaemiko.music")
+        self.__lag            : float          = 0.0
+        self.__lag_at         : float          = time.monotonic()
+        self.waiting          : int            = 0
+        self.rejected         : int            = 0
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    @property
+    def streams(self) -> int:
+        """Returns the number of guilds currently streaming"""
+        return len(self.__streams)
+
+    @property
+    def processes(self) -> int:
+        """Returns the number of live ffmpeg processes"""
+        return self.__processes
+
+    @property
+    def encode_lag(self) -> float:
+        """Returns the average per-frame delay, decayed by the time since the last frame"""
+        if not self.__streams:
+            return 0.0
+
+        return self.__decayed(time.monotonic())
+
+    def __decayed(self, now: float) -> float:
+        return self.__lag * 0.5 ** (max(0.0, now - self.__lag_at - LAG_GRACE) / LAG_HALF_LIFE)
+
+    def has_capacity(self) -> bool:
+        """Check if the node can take one more stream"""
+        return (
+            len(self.__streams) < self.__max_streams
+            and self.__processes < self.__max_processes
+            and self.encode_lag < self.__max_encode_lag
+        )
+
+    def check(self) -> None:
+        """Raise if the node is full, for requests that should not wait"""
+        if not self.has_capacity():
+            self.rejected += 1
+            raise CapacityExceeded(f"Node is at capacity ({self.streams} streams, {self.processes} processes)")
+
+    async def acquire(self, guild_id: int) -> None:
+        """Reserve a stream slot, waiting up to queue_timeout for one to free up"""
+        if guild_id in self.__streams:
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.__queue_timeout
+
+        self.waiting += 1
+        try:
+            while not self.has_capacity():
+                remaining = deadline - loop.time()
+
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise CapacityExceeded(f"No stream slot freed up within {self.__queue_timeout}s")
+
+                self.__released.clear()
+                try:
+                    await asyncio.wait_for(self.__released.wait(), min(remaining, 1))
+                except asyncio.TimeoutError:
+                    # Encode lag recovers without a release, so poll as well
+                    pass
+        finally:
+            self.waiting -= 1
+
+        self.__streams.add(guild_id)
+
+    def release(self, guild_id: int) -> None:
+        """Free the stream slot of a guild"""
+        if guild_id not in self.__streams:
+            return
+
+        self.__streams.discard(guild_id)
+        self.__released.set()
+
+    def process_spawned(self) -> None:
+        self.__processes += 1
+
+    def process_exited(self) -> None:
+        # Called from the audio thread when a source is cleaned up
+        self.__processes = max(0, self.__processes - 1)
+
+    def record_lag(self, lag: float) -> None:
+        """Fold a per-frame scheduling delay into the node-wide average"""
+        now = time.monotonic()
+        self.__lag, self.__lag_at = self.__decayed(now) * 0.99 + lag * 0.01, now
+
+    @property
+    def headroom(self) -> Dict[str, Any]:
+        """Returns how much of each limit is still free"""
+        return {
+            "streams": self.streams,
+            "max_streams": self.__max_streams,
+            "processes": self.processes,
+            "max_processes": self.__max_processes,
+            "encode_lag_ms": self.encode_lag * 1000,
+            "max_encode_lag_ms": self.__max_encode_lag * 1000,
+            "free_streams": max(0, min(
+                self.__max_streams - self.streams,
+                self.__max_processes - self.processes
+            )),
+            "waiting": self.waiting,
+            "rejected": self.rejected
+        }
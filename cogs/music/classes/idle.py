@@ -0,0 +1,100 @@
+"""
+This file contains the IdleScheduler class which runs the
+auto-disconnect timers of every guild from one task.
+"""
+from typing import Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import heapq
+import logging
+
+class IdleScheduler:
+    def __init__(self, timeout: float, on_idle: Callable[[int], Awaitable[None]]) -> None:
+        self.__timeout   : float                                = timeout
+        self.__on_idle   : Callable[[int], Awaitable[None]]     = on_idle
+        # Cancelled timers stay in the heap until they reach the top
+        self.__heap      : List[Tuple[float, int]]              = []
+        self.__deadlines : Dict[int, float]                     = {}
+        self.__wakeup    : asyncio.Event                        = asyncio.Event()
+        self.__task      : asyncio.Task                         = None
+        self.__logger    : logging.Logger                       = logging.getLogger("yaemiko.music")
+        self.fired       : int                                  = 0
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    @property
+    def pending(self) -> int:
+        """Returns the number of armed timers"""
+        return len(self.__deadlines)
+
+    def is_armed(self, guild_id: int) -> bool:
+        return guild_id in self.__deadlines
+
+    def arm(self, guild_id: int) -> None:
+        """Start the idle timer of a guild, an armed timer keeps its deadline"""
+        if guild_id in self.__deadlines:
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.__timeout
+
+        self.__deadlines[guild_id] = deadline
+        heapq.heappush(self.__heap, (deadline, guild_id))
+
+        if not self.__task or self.__task.done():
+            self.__task = loop.create_task(self.__run())
+        elif self.__heap[0][1] == guild_id:
+            self.__wakeup.set()
+
+        self.logger.debug(f"Armed auto-disconnect timer in guild: ({guild_id}).")
+
+    def cancel(self, guild_id: int) -> None:
+        """Stop the idle timer of a guild"""
+        if self.__deadlines.pop(guild_id, None) is None:
+            return
+
+        # Rebuild once stale entries outnumber live ones
+        if len(self.__heap) > 2 * len(self.__deadlines) + 64:
+            self.__heap = [(deadline, guild) for guild, deadline in self.__deadlines.items()]
+            heapq.heapify(self.__heap)
+
+        self.logger.debug(f"Cancelled auto-disconnect timer in guild: ({guild_id}).")
+
+    async def __run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while self.__deadlines:
+            # Drop timers that were cancelled or re-armed since they were pushed
+            while self.__heap and self.__deadlines.get(self.__heap[0][1]) != self.__heap[0][0]:
+                heapq.heappop(self.__heap)
+
+            if not self.__heap:
+                break
+
+            delay = self.__heap[0][0] - loop.time()
+
+            if delay > 0:
+                self.__wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.__wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, guild_id = heapq.heappop(self.__heap)
+            del self.__deadlines[guild_id]
+            self.fired += 1
+
+            try:
+                await self.__on_idle(guild_id)
+            except Exception as e:
+                self.logger.exception(f"Auto-disconnect failed in guild: ({guild_id}): {e}")
+
+    def close(self) -> None:
+        """Drop every timer and stop the scheduler task"""
+        self.__deadlines.clear()
+        self.__heap.clear()
+
+        if self.__task and not self.__task.done():
+            self.__task.cancel()
@@ -2,25 +2,125 @@
 This file contains the Music class which manages
 instances of the music player.
 """
+from typing import Any, Coroutine, Dict, Optional, Set
+import asyncio
+import json
 import logging
+import os
+import time
 
 from discord.ext import commands
 
+from .extractor import Extractor
+from .favorites import FavoritesStore
+from .governor import Governor
 from .player import Player
+from .search import YouTubeSearch
+from .track_cache import TrackCache
 
 class Music:
-    def __init__(self) -> None:
+    def __init__(self, client: commands.Bot, settings: Dict[str, Any] = None) -> None:
+        self.__client   = client
         self.__players  = {}
         self.logger: logging.Logger = logging.getLogger("yaemiko.music")
 
+        # Lifecycle
+        self.__tasks    : Set[asyncio.Task]   = set()
+        self.__reaper   : asyncio.Task        = None
+        self.__orphaned : Dict[int, float]    = {}
+        self.evicted    : int                 = 0
+
+        self.__settings: Dict[str, Any] = settings or {}
+        settings = self.__settings
+        cache_settings = settings.get("track_cache", {})
+
+        self.__track_cache: TrackCache = TrackCache(
+            max_entries=cache_settings.get("max_entries", 1024),
+            query_ttl=cache_settings.get("query_ttl", 604800),
+            expiry_margin=cache_settings.get("expiry_margin", 600),
+            path=cache_settings.get("path") if cache_settings.get("persist") else None
+        )
+
+        with open(os.path.join(os.path.dirname(__file__), '..', 'ydl_options.json'), 'r') as f:
+            ydl_options = json.load(f)
+
+        extractor_settings = settings.get("extractor", {})
+
+        self.__extractor: Extractor = Extractor(
+            ydl_options,
+            workers=extractor_settings.get("workers", 4),
+            mode=extractor_settings.get("mode", "thread"),
+            max_pending=extractor_settings.get("max_pending", 32),
+            timeout=extractor_settings.get("timeout", 30)
+        )
+
+        search_settings = settings.get("search", {})
+
+        self.__search: YouTubeSearch = YouTubeSearch(
+            lambda: client.http_session,
+            limit=search_settings.get("limit", 5),
+            max_entries=search_settings.get("max_entries", 512),
+            ttl=search_settings.get("ttl", 3600)
+        )
+
+        governor_settings = settings.get("governor", {})
+
+        self.__governor: Governor = Governor(
+            max_streams=governor_settings.get("max_streams", 50),
+            max_processes=governor_settings.get("max_processes", 60),
+            max_encode_lag=governor_settings.get("max_encode_lag", 15),
+            queue_timeout=governor_settings.get("queue_timeout", 10)
+        )
+
+        favorites_settings = settings.get("favorites", {})
+
+        self.__favorites: FavoritesStore = FavoritesStore(favorites_settings.get("path", "data/favorites.db"))
+
+    @property
+    def favorites(self) -> FavoritesStore:
+        """Returns the per-user favorites store"""
+        return self.__favorites
+
+    @property
+    def governor(self) -> Governor:
+        """Returns the node-wide stream capacity governor"""
+        return self.__governor
+
+    @property
+    def search(self) -> YouTubeSearch:
+        """Returns the YouTube search component"""
+        return self.__search
+
+    @property
+    def extractor(self) -> Extractor:
+        """Returns the shared yt-dlp extraction engine"""
+        return self.__extractor
+
+    @property
+    def settings(self) -> Dict[str, Any]:
+        """Returns the music cog settings"""
+        return self.__settings
+
+    @property
+    def track_cache(self) -> TrackCache:
+        """Returns the shared track metadata cache"""
+        return self.__track_cache
+
     def create_player(self, ctx: commands.Context) -> Player:
         """Create player instance"""
         if ctx.guild.id in self.__players:
             return self.__players.get(ctx.guild.id)
 
-        player = Player(ctx)
+        # New sessions are turned away outright when the node is full
+        self.governor.check()
+
+        player = Player(self.__client, ctx.guild.id, ctx.channel.id, self)
         self.__players[ctx.guild.id] = player
-        self.logger.info(f"Created Player instance (Guild ID: {player.channel.guild.id})")
+        self.logger.info(f"Created Player instance (Guild ID: {player.guild_id})")
+
+        if not self.__reaper or self.__reaper.done():
+            self.__reaper = self.spawn(self.__reap())
+
         return player
 
     def get_player(self, player_id: int) -> Player:
@@ -32,6 +132,96 @@ class Music:
         player = self.get_player(player_id)
 
         if player:
-            self.logger.info(f"Destroyed Player instance (Guild ID: {player.channel.guild.id})")
-            player.loop.create_task(player.stop())
+            self.logger.info(f"Destroyed Player instance (Guild ID: {player.guild_id})")
+            self.spawn(player.close())
             self.__players.pop(player_id)
+            self.__orphaned.pop(player_id, None)
+            self.governor.release(player_id)
+
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        """Run a background task that is cancelled when the cog unloads"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+        return task
+
+    # Lifecycle
+    async def __reap(self) -> None:
+        """Periodically evicts players nobody can use anymore"""
+        interval = self.settings.get("lifecycle", {}).get("sweep_interval", 60)
+
+        while self.__players:
+            await asyncio.sleep(interval)
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Evict idle and orphaned players, returns how many were evicted"""
+        now = time.monotonic()
+        evicted = 0
+
+        for guild_id, player in list(self.__players.items()):
+            reason = self.eviction_reason(player, now)
+
+            if not reason:
+                continue
+
+            self.logger.info(f"Evicting player, {reason} (Guild ID: {guild_id})")
+
+            voice_client = player.voice_client
+            self.close_player(guild_id)
+
+            if voice_client:
+                self.spawn(voice_client.disconnect())
+
+            evicted += 1
+
+        self.evicted += evicted
+        return evicted
+
+    def eviction_reason(self, player: Player, now: float) -> Optional[str]:
+        """Returns why a player should be evicted, or None to keep it"""
+        settings = self.settings.get("lifecycle", {})
+        guild = player.guild
+
+        if not guild or guild.unavailable or not player.voice_client or not player.channel:
+            # A player is briefly without a voice client while /play connects
+            since = self.__orphaned.setdefault(player.guild_id, now)
+
+            if now - since >= settings.get("orphan_timeout", 300):
+                return "guild, voice client or channel is gone"
+
+            return None
+
+        self.__orphaned.pop(player.guild_id, None)
+
+        if player.idle_since and now - player.idle_since >= settings.get("idle_timeout", 900):
+            return "idle"
+
+        return None
+
+    @property
+    def players(self) -> int:
+        """Returns the number of live players"""
+        return len(self.__players)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Returns player lifecycle counters and approximate memory use"""
+        memory = sum(player.memory for player in self.__players.values())
+
+        return {
+            "players": self.players,
+            "memory": memory,
+            "per_player": memory // self.players if self.players else 0,
+            "evicted": self.evicted,
+            "tasks": len(self.__tasks)
+        }
+
+    def close(self) -> None:
+        """Release resources shared by all players"""
+        for task in list(self.__tasks):
+            task.cancel()
+
+        self.extractor.close()
+        self.track_cache.close()
+        self.favorites.close()
@@ -1,27 +1,60 @@
-from typing import Dict, Union
+from collections import deque
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 import asyncio
 import json
 import logging
 import os
+import sys
+import time
+
+import aiohttp
 
 import discord
 from discord.ext import commands
 
+from core.message import Responses
+
+from .extractor import ExtractorBusy
+from .governor import CapacityExceeded
 from .player_ui import PlayerUI
-from .queue import Queue
-from .song import Song, fetch_track
+from .queue import LoopMode, Queue
+from .song import Song, fetch_track, playlist_id_from_url, song_from_entry, song_size, stream_expires_at
+from .sources import MeteredSource, PrebufferedSource
+
+if TYPE_CHECKING:
+    from .music import Music
 
 class Player:
-    def __init__(self, ctx: discord.ext.commands.Context) -> None:
-        self.__channel     : discord.TextChannel        = ctx.channel
-        self.__ctx         : commands.Context           = ctx
+    def __init__(self, client: commands.Bot, guild_id: int, channel_id: int, music: "Music") -> None:
+        # Only IDs are kept, objects are looked up from the client cache when needed
+        self.__client      : commands.Bot               = client
+        self.__guild_id    : int                        = guild_id
+        self.__channel_id  : int                        = channel_id
+        self.__music       : "Music"                    = music
         self.__is_playing  : bool                       = False
-        self.__last_song   : Song                       = None
         self.__logger      : logging.Logger             = logging.getLogger("yaemiko.music.player")
         self.__now_playing : Song                       = None
-        self.__queue       : Queue                      = Queue()
+        self.__queue       : Queue                      = Queue(music.settings.get("queue", {}).get("history_size", 50))
         self.__volume      : float                      = 1.0
-        self.__ui          : PlayerUI                   = PlayerUI(self.channel)
+        self.__ui          : PlayerUI                   = PlayerUI(
+            client,
+            channel_id,
+            music.settings.get("ui", {}).get("min_render_interval", 2.0),
+            music.settings.get("ui", {}).get("embed_cache_size", 32)
+        )
+        self.__started_at  : float                      = None
+        self.__paused_at   : float                      = None
+        self.__prefetch    : asyncio.Task               = None
+        self.__skipping    : bool                       = False
+        self.__rewinding   : bool                       = False
+        self.__retries     : int                        = 0
+        self.__transitions : asyncio.Queue              = asyncio.Queue()
+        self.__transition_worker : asyncio.Task         = None
+        self.__latencies   : deque                      = deque(maxlen=50)
+        self.__spare       : Tuple[Song, PrebufferedSource] = None
+        self.__expansion   : asyncio.Task               = None
+        self.__idle_since  : float                      = time.monotonic()
+        self.__closed      : bool                       = False
 
         with open(os.path.join(os.path.dirname(__file__), '..', 'ffmpeg_options.json'), 'r') as f:
             self.__FFMPEG_OPTS = json.load(f)
@@ -33,19 +66,33 @@ class Player:
         return self.__FFMPEG_OPTS
     
     @property
-    def channel(self) -> discord.TextChannel:
-        """Return player channel"""
-        return self.__channel
+    def client(self) -> commands.Bot:
+        return self.__client
 
     @property
-    def ctx(self) -> commands.Context:
-        """Returns the player context"""
-        return self.__ctx
+    def guild_id(self) -> int:
+        return self.__guild_id
 
     @property
-    def channel(self) -> discord.TextChannel:
+    def guild(self) -> Optional[discord.Guild]:
+        """Fetch the guild of the player from the client cache"""
+        return self.__client.get_guild(self.__guild_id)
+
+    @property
+    def channel(self) -> Optional[discord.TextChannel]:
         """Fetch channel the player was created from"""
-        return self.__ctx.channel
+        return self.__client.get_channel(self.__channel_id)
+
+    @property
+    def voice_client(self) -> Optional[discord.VoiceClient]:
+        """Fetch the voice client of the guild, None once it is gone"""
+        guild = self.guild
+        return guild.voice_client if guild else None
+
+    @property
+    def idle_since(self) -> Optional[float]:
+        """Returns the monotonic time the player stopped playing, None while playing"""
+        return self.__idle_since
 
     @property
     def is_playing(self) -> bool:
@@ -58,11 +105,7 @@ class Player:
 
     @property
     def last_song(self) -> Song:
-        return self.__last_song
-    
-    @last_song.setter
-    def last_song(self, song: Song) -> None:
-        self.__last_song = song
+        return self.queue.last
 
     @property
     def logger(self) -> logging.Logger:
@@ -71,7 +114,12 @@ class Player:
     @property
     def loop(self) -> asyncio.BaseEventLoop:
         """Returns the event loop"""
-        return self.__ctx.bot.loop
+        return self.__client.loop
+
+    @property
+    def music(self) -> "Music":
+        """Returns the Music instance that owns the player"""
+        return self.__music
 
     @property
     def now_playing(self) -> Song:
@@ -81,9 +129,6 @@ class Player:
     @now_playing.setter
     def now_playing(self, song: Song) -> None:
         """Set currently playing song"""
-        if not song:
-            return
-        
         self.__now_playing = song
 
     @property
@@ -106,78 +151,647 @@ class Player:
     @property
     def ui(self) -> PlayerUI:
         return self.__ui
+
+    @property
+    def memory(self) -> int:
+        """Returns an approximate number of bytes held by the player state"""
+        songs = [*self.queue, *self.queue.history, self.now_playing]
+
+        size = sum(song_size(song) for song in songs if song)
+        size += sys.getsizeof(self.queue.items) + sys.getsizeof(self.queue.history)
+        size += self.ui.memory
+
+        if self.__spare:
+            size += self.__spare[1].buffered_bytes
+
+        return size
     
     def update_ui(self) -> None:
-        self.loop.create_task(self.ui.render_np(self))
+        # May be called from the audio thread
+        self.loop.call_soon_threadsafe(self.ui.request_render, self)
+
+    # Prefetching
+    def schedule_prefetch(self) -> None:
+        """Arm the prefetch stage for the head of the queue"""
+        self.cancel_prefetch()
+
+        settings = self.music.settings.get("prefetch", {})
+        song = self.now_playing
+
+        if not settings.get("enabled", True) or not song or not self.__started_at or self.queue.is_empty():
+            return
+
+        # Live streams have no known end
+        if not song.duration:
+            return
+
+        elapsed = (self.__paused_at or self.loop.time()) - self.__started_at
+        delay = max(0, song.duration - elapsed - settings.get("lead", 15))
+
+        self.__prefetch = self.music.spawn(self.prefetch(delay))
+
+    def cancel_prefetch(self) -> None:
+        """Cancel a pending prefetch stage and any spare source"""
+        if self.__prefetch and not self.__prefetch.done():
+            self.__prefetch.cancel()
+
+        self.__prefetch = None
+        self.discard_spare()
+
+    def discard_spare(self) -> None:
+        """Kill the pre-spawned ffmpeg process of the next track"""
+        if not self.__spare:
+            return
+
+        self.__spare[1].cleanup()
+        self.__spare = None
+
+        self.logger.debug(f"Discarded spare source (ID: {self.guild_id})")
+
+    async def prefetch(self, delay: float) -> None:
+        """Re-validates the head of the queue shortly before it plays"""
+        await asyncio.sleep(delay)
+
+        song = self.queue.peek()
+        if not song:
+            return
+
+        fresh = await self.refresh_song(song)
+
+        if fresh and fresh is not song and self.queue.replace(song, fresh):
+            self.logger.debug(f"Re-resolved next track before playback (ID: {self.guild_id})")
+            song = fresh
+
+        if not song.resolved:
+            return
+
+        gapless = self.music.settings.get("gapless", {})
+        current = self.now_playing
+
+        if not gapless.get("enabled", False) or not current or not current.duration:
+            return
+
+        elapsed = self.loop.time() - self.__started_at
+        await asyncio.sleep(max(0, current.duration - elapsed - gapless.get("lead", 5)))
+
+        await self.spawn_spare(song)
+
+    async def spawn_spare(self, song: Song) -> None:
+        """Start ffmpeg for the next track and buffer its first frames"""
+        gapless = self.music.settings.get("gapless", {})
+
+        if self.queue.peek() is not song:
+            return
+
+        source = PrebufferedSource(await self.create_source(song), gapless.get("buffer_frames", 50))
+
+        prefill = self.loop.run_in_executor(None, source.prefill)
+
+        def cleanup(future: asyncio.Future) -> None:
+            if not future.cancelled():
+                future.exception()
+            source.cleanup()
+
+        def abandon() -> None:
+            # ffmpeg is only torn down once the reading thread let go of it
+            source.stop()
+            prefill.add_done_callback(cleanup)
 
-    def play_song(self) -> None:
-        """Handles audio streaming to Discord"""
         try:
-            self.last_song = self.now_playing
-            self.now_playing = self.queue.dequeue()
-
-            source = discord.PCMVolumeTransformer(
-                discord.FFmpegPCMAudio(
-                    self.now_playing.source,
-                    **self.FFMPEG_OPTS
-                ),
-                volume = self.volume
+            # Shielded so giving up does not mark prefill done while its thread still reads
+            frames = await asyncio.wait_for(asyncio.shield(prefill), gapless.get("spawn_timeout", 5))
+        except asyncio.TimeoutError:
+            self.logger.debug(f"Timed out pre-buffering next track (ID: {self.guild_id})")
+            abandon()
+            return
+        except asyncio.CancelledError:
+            abandon()
+            raise
+
+        # The queue may have changed while ffmpeg was starting
+        if self.queue.peek() is not song or not frames:
+            source.cleanup()
+            return
+
+        self.discard_spare()
+        self.__spare = (song, source)
+
+        self.logger.debug(f"Pre-buffered {frames} frames of next track (ID: {self.guild_id})")
+
+    async def create_source(self, song: Song) -> discord.AudioSource:
+        """Spawns ffmpeg for a song"""
+        source = None
+
+        if self.music.settings.get("passthrough", {}).get("enabled", False):
+            source = await self.create_opus_source(song)
+
+        if not source:
+            source = discord.FFmpegPCMAudio(
+                song.source,
+                **self.FFMPEG_OPTS
             )
 
-            for i in range(1, 3 + 1):
-                self.ctx.voice_client.play(source, after = lambda error: self.play_song())
+        self.music.governor.process_spawned()
+
+        return MeteredSource(source, on_cleanup=self.music.governor.process_exited)
+
+    async def create_opus_source(self, song: Song) -> Union[discord.FFmpegOpusAudio, None]:
+        """Spawns ffmpeg so it emits Opus packets, skipping PCM decode and re-encode in Python"""
+        codec = song.codec
+
+        if not codec:
+            try:
+                codec, _ = await discord.FFmpegOpusAudio.probe(song.source)
+            except Exception as e:
+                self.logger.debug(f"Failed to probe stream, using PCM: {e} (ID: {self.guild_id})")
+                return None
+
+        options = self.FFMPEG_OPTS.get("options", "")
+
+        # Opus at full volume is copied as is (discord.py maps "opus" to -c:a copy),
+        # anything else is encoded by ffmpeg with the volume as a filter
+        if codec != "opus" or self.volume != 1.0:
+            codec = None
+            options = f"{options} -filter:a volume={self.volume}"
+
+        return discord.FFmpegOpusAudio(
+            song.source,
+            codec=codec,
+            bitrate=self.music.settings.get("passthrough", {}).get("bitrate", 128),
+            before_options=self.FFMPEG_OPTS.get("before_options"),
+            options=options
+        )
+
+    async def refresh_song(self, song: Song) -> Union[Song, None]:
+        """Returns a song whose stream URL is still usable"""
+        settings = self.music.settings.get("prefetch", {})
+        lead = settings.get("lead", 15)
+
+        # Playlist entries have never been resolved, so there is nothing to validate
+        if song.resolved:
+            # The stream has to outlive the whole track, or ffmpeg reconnects will fail
+            if stream_expires_at(song.source) > time.time() + lead + song.duration:
+                try:
+                    async with self.client.http_session.get(
+                        song.source,
+                        headers={"Range": "bytes=0-0"},
+                        timeout=aiohttp.ClientTimeout(total=settings.get("validate_timeout", 5))
+                    ) as response:
+                        if response.status < 400:
+                            return song
+
+                        self.logger.debug(f"Stream URL rejected with status {response.status} (ID: {self.guild_id})")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.logger.debug(f"Failed to validate stream URL: {e} (ID: {self.guild_id})")
+
+            self.music.track_cache.invalidate(song.video_id)
 
-                if self.ctx.voice_client.is_playing():
-                    self.is_playing = True
+        try:
+            return await fetch_track(song.url, self.music.search, self.music.extractor, self.music.track_cache)
+        except ExtractorBusy as e:
+            self.logger.debug(f"{e} (ID: {self.guild_id})")
+            return None
 
-                    self.update_ui()
+    # Transitions
+    def on_track_end(self, error: Optional[Exception]) -> None:
+        """Voice client callback, runs on the audio thread"""
+        self.loop.call_soon_threadsafe(self.__signal, False, error, time.perf_counter())
 
-                    self.logger.debug(f"Transitioned to next song in the queue (ID: {self.ctx.guild.id})")
+    def play_song(self) -> None:
+        """Ask the transition worker to start playback"""
+        self.__signal(True, None, None)
 
-                    break
+    def __signal(self, start: bool, error: Optional[Exception], ended_at: Optional[float]) -> None:
+        # Stopping a closed player still fires the after callback
+        if self.__closed:
+            return
 
-                self.logger.debug(f"Playback failed. Retry: {i} (ID: {self.ctx.guild.id})")
-        # Expected error when there are no more tracks in queue
-        except IndexError:
-            self.now_playing = None
-            self.is_playing = False
+        self.__transitions.put_nowait((start, error, ended_at))
+
+        if not self.__transition_worker or self.__transition_worker.done():
+            self.__transition_worker = self.music.spawn(self.__run_transitions())
+
+    async def __run_transitions(self) -> None:
+        """Handles every track change of the player, one at a time"""
+        while not self.__transitions.empty():
+            start, error, ended_at = await self.__transitions.get()
+
+            try:
+                await self.transition(start, error, ended_at)
+            except Exception as e:
+                self.logger.exception(f"Transition failed: {e} (ID: {self.guild_id})")
+
+    async def transition(self, start: bool, error: Optional[Exception], ended_at: Optional[float]) -> Union[Song, None]:
+        """Advance to the next song, or retry the current one after a failed start"""
+        voice_client = self.voice_client
+
+        if not voice_client:
+            self.music.governor.release(self.guild_id)
+            return None
+
+        # A start request raced with a song that is already playing
+        if start and (voice_client.is_playing() or voice_client.is_paused()):
+            return self.now_playing
+
+        # Keep the spare source away from cancel_prefetch, it may be the next track
+        spare, self.__spare = self.__spare, None
+        self.cancel_prefetch()
+
+        if error:
+            self.logger.debug(f"Playback error: {error} (ID: {self.guild_id})")
+
+        # Only a track that failed right after starting is worth retrying
+        failed_start = self.__started_at is not None and self.loop.time() - self.__started_at < 5
+        retry = error and failed_start and self.now_playing and self.__retries < 2 and not self.__skipping and not self.__rewinding
+
+        if retry:
+            self.__retries += 1
+            song = self.now_playing
+            self.logger.debug(f"Retrying failed track. Retry: {self.__retries} (ID: {self.guild_id})")
+        else:
+            # Rewinding already put the current song back into the queue
+            current = None if self.__rewinding else self.now_playing
+            repeat = not self.__skipping
+            self.__rewinding = False
+            self.__skipping = False
+            self.__retries = 0
+
+            try:
+                song = self.queue.advance(current, repeat=repeat)
+            # Expected error when there are no more tracks in queue
+            except IndexError:
+                self.now_playing = None
+                self.is_playing = False
+                self.__idle_since = time.monotonic()
+
+                self.logger.debug(f"Playback finished, queue is empty (ID: {self.guild_id})")
+
+                if spare:
+                    spare[1].cleanup()
+
+                self.music.governor.release(self.guild_id)
+                await self.ui.remove_controls()
+                return None
+
+        if spare and (retry or spare[0] is not song):
+            spare[1].cleanup()
+            spare = None
 
-            self.logger.debug(f"Playback failed, queue might be empty (ID: {self.ctx.guild.id})")
+        for i in range(1, 3 + 1):
+            if spare:
+                # Gapless hand-off, ffmpeg is already running and buffered
+                inner, spare = spare[1], None
+            else:
+                # Stale or failing stream URLs are resolved again before ffmpeg sees them
+                if retry or i > 1 or stream_expires_at(song.source) < time.time() + song.duration:
+                    song = await self.refresh_song(song) or song
+
+                if not song.resolved:
+                    self.logger.debug(f"Failed to resolve track. Retry: {i} (ID: {self.guild_id})")
+                    continue
+
+                inner = await self.create_source(song)
+
+            source = MeteredSource(
+                inner,
+                self.__first_frame_callback(ended_at),
+                self.music.governor.record_lag
+            )
 
-            # FIXME: update ui
-            self.loop.create_task(self.ui.remove_controls())
+            # Opus sources have their volume applied by ffmpeg
+            if not inner.is_opus():
+                source = discord.PCMVolumeTransformer(
+                    source,
+                    volume = self.volume
+                )
 
-        return self.now_playing
+            # Another signal started a track while this one was resolving
+            if voice_client.is_playing() or voice_client.is_paused():
+                source.cleanup()
+                return self.now_playing
+
+            try:
+                voice_client.play(source, after = self.on_track_end)
+            except discord.ClientException as e:
+                self.logger.debug(f"Playback failed: {e}. Retry: {i} (ID: {self.guild_id})")
+                source.cleanup()
+                continue
+
+            self.now_playing = song
+            self.is_playing = True
+            self.__started_at = self.loop.time()
+            self.__paused_at = None
+            self.__idle_since = None
+
+            self.update_ui()
+            self.schedule_prefetch()
+
+            self.logger.debug(f"Transitioned to next song in the queue (ID: {self.guild_id})")
+
+            return song
+
+        self.now_playing = None
+        self.is_playing = False
+        self.__idle_since = time.monotonic()
+        self.logger.debug(f"Giving up on track after failed retries (ID: {self.guild_id})")
+
+        # Move on so one broken track does not stall the queue, as a start
+        # request so it is dropped if a queued start already began a track
+        self.__signal(True, None, None)
+        return None
+
+    def __first_frame_callback(self, ended_at: Optional[float]) -> Optional[Callable[[float], None]]:
+        if ended_at is None:
+            return None
+
+        def record(first_frame_at: float) -> None:
+            self.__latencies.append(first_frame_at - ended_at)
 
-    async def play(self, query: str, interaction: discord.Interaction) -> Dict[str, Union[bool, Song]]:
+        return record
+
+    @property
+    def transition_stats(self) -> Dict[str, float]:
+        """Returns gap between end of track and first frame of the next, in ms"""
+        latencies = list(self.__latencies)
+
+        if not latencies:
+            return {"count": 0, "last": 0.0, "avg": 0.0, "max": 0.0}
+
+        return {
+            "count": len(latencies),
+            "last": latencies[-1] * 1000,
+            "avg": sum(latencies) / len(latencies) * 1000,
+            "max": max(latencies) * 1000
+        }
+
+    async def play(self, query: str, interaction: Optional[discord.Interaction] = None) -> Dict[str, Union[bool, Song]]:
         """Entry point for playing audio"""
+        if playlist_id_from_url(query):
+            return await self.play_playlist(query, interaction)
+
         for i in range(1, 3 + 1):
-            song = await fetch_track(query, self.loop)
+            try:
+                song = await fetch_track(query, self.music.search, self.music.extractor, self.music.track_cache)
+            except ExtractorBusy as e:
+                self.logger.debug(f"{e} (ID: {self.guild_id})")
+                await self.ui.send_error(interaction, Responses.music_extractor_busy)
+                return None
 
             if song:
+                if not self.now_playing:
+                    try:
+                        await self.music.governor.acquire(self.guild_id)
+                    except CapacityExceeded as e:
+                        self.logger.debug(f"{e} (ID: {self.guild_id})")
+                        await self.ui.send_error(interaction, Responses.music_node_full)
+                        return None
+
                 self.queue.enqueue(song)
 
                 if self.ui.screen:
                     await self.ui.send_queue_msg(interaction, song)
                     self.update_ui()
                 
-                if not self.is_playing:
-                    song = self.play_song()
-                    self.logger.debug(f"Started playback (ID: {self.ctx.guild.id})")
+                if not self.now_playing:
+                    self.play_song()
+                    self.logger.debug(f"Started playback (ID: {self.guild_id})")
                 else:
-                    self.logger.debug(f"Queued track (ID: {self.ctx.guild.id})")
+                    if self.queue.size() == 1:
+                        self.schedule_prefetch()
+
+                    self.logger.debug(f"Queued track (ID: {self.guild_id})")
 
                 break
 
-            self.logger.debug(f"Failed to fetch song data. Retry: {i} (ID: {self.ctx.guild.id})")
+            self.logger.debug(f"Failed to fetch song data. Retry: {i} (ID: {self.guild_id})")
 
         return song
 
+    async def play_many(
+        self,
+        queries: List[str],
+        on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+    ) -> List[Optional[Song]]:
+        """Resolves many queries concurrently and enqueues them in order,
+        returns the song each query resolved to or None"""
+        settings = self.music.settings.get("bulk_enqueue", {})
+        semaphore = asyncio.Semaphore(settings.get("concurrency", 4))
+        interval = settings.get("progress_interval", 2.0)
+
+        async def resolve(query: str) -> Union[Song, None]:
+            async with semaphore:
+                for i in range(1, 3 + 1):
+                    try:
+                        song = await fetch_track(query, self.music.search, self.music.extractor, self.music.track_cache)
+                    except ExtractorBusy:
+                        # Back off and let other guilds drain the extractor
+                        await asyncio.sleep(i)
+                        continue
+                    except aiohttp.ClientError as e:
+                        self.logger.debug(f"Search failed for '{query}': {e} (ID: {self.guild_id})")
+                        await asyncio.sleep(i)
+                        continue
+                    except Exception as e:
+                        # A private or removed video must not abort the rest of the batch
+                        self.logger.exception(f"Failed to fetch '{query}': {e} (ID: {self.guild_id})")
+                        return None
+
+                    if song:
+                        return song
+
+                self.logger.debug(f"Failed to fetch song data for '{query}' (ID: {self.guild_id})")
+                return None
+
+        async def progress() -> bool:
+            # The progress message may be gone, that must not lose the resolved songs
+            try:
+                await on_progress(resolved, len(queries))
+                return True
+            except discord.HTTPException as e:
+                self.logger.debug(f"Failed to report progress: {e} (ID: {self.guild_id})")
+                return False
+
+        async def report() -> None:
+            reported = -1
+            while True:
+                if resolved != reported:
+                    reported = resolved
+
+                    if not await progress():
+                        return
+
+                await asyncio.sleep(interval)
+
+        # Raises CapacityExceeded before any work is done if the node is full
+        if not self.now_playing:
+            await self.music.governor.acquire(self.guild_id)
+
+        tasks = {self.loop.create_task(resolve(query)): index for index, query in enumerate(queries)}
+        results: Dict[int, Union[Song, None]] = {}
+        songs: List[Optional[Song]] = [None] * len(queries)
+        resolved = 0
+        next_index = 0
+
+        reporter = self.loop.create_task(report()) if on_progress else None
+
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    results[tasks[task]] = task.result()
+                    resolved += 1
+
+                # Only release the contiguous prefix so the queue keeps the requested order
+                enqueued = False
+                while next_index in results:
+                    song = results.pop(next_index)
+                    songs[next_index] = song
+                    next_index += 1
+
+                    if not song:
+                        continue
+
+                    self.queue.enqueue(song)
+                    enqueued = True
+
+                    if not self.now_playing:
+                        self.play_song()
+                        self.logger.debug(f"Started playback (ID: {self.guild_id})")
+
+                if enqueued and self.ui.screen:
+                    self.update_ui()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            if reporter:
+                reporter.cancel()
+
+        if on_progress:
+            await progress()
+
+        self.logger.debug(f"Queued {len(queries) - songs.count(None)} of {len(queries)} tracks (ID: {self.guild_id})")
+
+        return songs
+
+    async def play_playlist(self, url: str, interaction: Optional[discord.Interaction] = None) -> Union[Song, None]:
+        """Queues a playlist from flat pages, the first page is queued before this returns"""
+        settings = self.music.settings.get("playlist", {})
+        page_size = settings.get("page_size", 100)
+        max_entries = settings.get("max_entries", 500)
+
+        try:
+            page = await self.music.extractor.extract_playlist(url, 1, min(page_size, max_entries))
+        except ExtractorBusy as e:
+            self.logger.debug(f"{e} (ID: {self.guild_id})")
+            await self.ui.send_error(interaction, Responses.music_extractor_busy)
+            return None
+
+        if not page or not page["entries"]:
+            self.logger.debug(f"Playlist has no playable entries: '{url}' (ID: {self.guild_id})")
+            await self.ui.send_error(interaction, Responses.music_playlist_empty)
+            return None
+
+        if not self.now_playing:
+            try:
+                await self.music.governor.acquire(self.guild_id)
+            except CapacityExceeded as e:
+                self.logger.debug(f"{e} (ID: {self.guild_id})")
+                await self.ui.send_error(interaction, Responses.music_node_full)
+                return None
+
+        first = song_from_entry(page["entries"][0])
+        self.enqueue_entries(page["entries"])
+
+        await self.ui.send_playlist_msg(interaction, page["title"] or url, len(page["entries"]), first)
+
+        # The rest of the playlist is listed while the first track plays
+        if len(page["entries"]) >= page_size and page_size < max_entries:
+            if self.__expansion and not self.__expansion.done():
+                self.__expansion.cancel()
+
+            self.__expansion = self.music.spawn(self.expand_playlist(url, page_size + 1, max_entries))
+
+        return first
+
+    async def expand_playlist(self, url: str, start: int, max_entries: int) -> None:
+        """Streams the remaining pages of a playlist into the queue"""
+        page_size = self.music.settings.get("playlist", {}).get("page_size", 100)
+        retries = 0
+
+        try:
+            while start <= max_entries:
+                # The player was closed or replaced, nothing left to queue into
+                if self.music.get_player(self.guild_id) is not self:
+                    return
+
+                end = min(start + page_size - 1, max_entries)
+
+                try:
+                    page = await self.music.extractor.extract_playlist(url, start, end)
+                except ExtractorBusy:
+                    if retries == 5:
+                        self.logger.warning(f"Extractor stayed busy, stopped expanding playlist at entry {start} (ID: {self.guild_id})")
+                        return
+
+                    # Back off and let other guilds drain the extractor
+                    await asyncio.sleep(2 ** retries)
+                    retries += 1
+                    continue
+
+                retries = 0
+
+                if not page:
+                    self.logger.warning(f"Timed out listing playlist entries {start}-{end}, stopped expanding (ID: {self.guild_id})")
+                    return
+
+                if not page["entries"]:
+                    break
+
+                self.enqueue_entries(page["entries"])
+
+                if len(page["entries"]) < end - start + 1:
+                    break
+
+                start = end + 1
+        except Exception as e:
+            self.logger.exception(f"Failed to expand playlist at entry {start}: {e} (ID: {self.guild_id})")
+            return
+
+        self.logger.debug(f"Finished expanding playlist (ID: {self.guild_id})")
+
+    def enqueue_entries(self, entries: List[Dict[str, Any]]) -> None:
+        """Queues flat playlist entries, they are resolved right before they play"""
+        was_empty = self.queue.is_empty()
+
+        for entry in entries:
+            self.queue.enqueue(song_from_entry(entry))
+
+        if not self.now_playing:
+            self.play_song()
+            self.logger.debug(f"Started playback (ID: {self.guild_id})")
+        elif was_empty:
+            self.schedule_prefetch()
+
+        if self.ui.screen:
+            self.update_ui()
+
+        self.logger.debug(f"Queued {len(entries)} playlist entries (ID: {self.guild_id})")
+
     # Player controls
     def set_volume(self, volume: int) -> float:
         """Set player volume"""
         self.volume = volume
-        self.ctx.voice_client.source.volume = self.volume
+
+        source = self.voice_client.source
+
+        # Passthrough sources pick up the new volume from the next track
+        if isinstance(source, discord.PCMVolumeTransformer):
+            source.volume = self.volume
+        else:
+            self.discard_spare()
 
         return self.volume
 
@@ -185,47 +799,96 @@ class Player:
         """Remove an item from the queue"""
         if not index in range(0, len(self.queue)):
             return
-        
+
+        song = self.queue.dequeue(index)
+
+        if index == 0:
+            self.schedule_prefetch()
+
         self.update_ui()
-        
-        return self.dequeue(index - 1)
+
+        return song
+
+    def move_song(self, source: int, destination: int) -> Union[Song, None]:
+        """Move an item to another position in the queue"""
+        if not source in range(0, len(self.queue)) or not destination in range(0, len(self.queue)):
+            return
+
+        song = self.queue.move(source, destination)
+
+        if 0 in (source, destination):
+            self.schedule_prefetch()
+
+        self.update_ui()
+
+        return song
+
+    def shuffle(self) -> None:
+        """Shuffle the queue in place"""
+        self.queue.shuffle()
+        self.schedule_prefetch()
+        self.update_ui()
+
+    def set_loop_mode(self, mode: LoopMode) -> LoopMode:
+        """Set the queue loop mode"""
+        self.queue.loop_mode = mode
+        self.update_ui()
+
+        return mode
 
     async def skip(self) -> Union[Song, None]:
         """Skip currently playing song"""
-        self.ctx.voice_client.stop()
+        self.__skipping = True
+        self.voice_client.stop()
 
-        self.logger.debug(f"Skippped to next track (ID: {self.ctx.guild.id})")
+        self.logger.debug(f"Skippped to next track (ID: {self.guild_id})")
 
         return self.now_playing
 
     async def prev(self) -> Union[Song, None]:
         """Play the previous song"""
-        self.queue.items.insert(0, self.last_song)
-        self.ctx.voice_client.stop()
+        if not self.queue.last:
+            return self.now_playing
+
+        if self.now_playing:
+            self.queue.enqueue_front(self.now_playing)
 
-        self.logger.debug(f"Skipped to previous track (ID: {self.ctx.guild.id})")
+        self.queue.enqueue_front(self.queue.previous())
+        self.__rewinding = True
+        self.voice_client.stop()
+
+        self.logger.debug(f"Skipped to previous track (ID: {self.guild_id})")
         
         return self.now_playing
 
     async def pause(self) -> Union[Song, None]:
         """Pauses playback of current song"""
         self.is_playing = False
-        self.ctx.voice_client.pause()
+        self.voice_client.pause()
+        self.__paused_at = self.loop.time()
+        self.__idle_since = time.monotonic()
+        self.cancel_prefetch()
 
         self.update_ui()
 
-        self.logger.debug(f"Paused playback (ID: {self.__ctx.guild.id})")
+        self.logger.debug(f"Paused playback (ID: {self.guild_id})")
 
         return self.now_playing
 
     async def resume(self) -> Union[Song, None]:
         """Resumes playback of current song"""
         self.is_playing = True
-        self.ctx.voice_client.resume()
+        self.voice_client.resume()
+        self.__idle_since = None
+
+        if self.__paused_at and self.__started_at:
+            self.__started_at += self.loop.time() - self.__paused_at
+        self.__paused_at = None
+        self.schedule_prefetch()
 
         self.update_ui()
 
-        self.logger.debug(f"Resumed playback (ID: {self.__ctx.guild.id})")
+        self.logger.debug(f"Resumed playback (ID: {self.guild_id})")
 
         return self.now_playing
 
@@ -233,14 +896,32 @@ class Player:
         """Stop audio stream"""
         song = self.now_playing
         self.now_playing = None
-        self.queue.items.clear()
+        self.queue.clear()
+        self.cancel_prefetch()
 
-        self.logger.debug(f"Cleared queue (ID: {self.__ctx.guild.id})")
+        if self.__expansion and not self.__expansion.done():
+            self.__expansion.cancel()
 
-        self.ctx.voice_client.stop()
+        self.__idle_since = time.monotonic()
 
-        self.logger.debug(f"Stopped playback (ID: {self.__ctx.guild.id})")
+        self.logger.debug(f"Cleared queue (ID: {self.guild_id})")
+
+        # An evicted player may have lost its voice client already
+        if self.voice_client:
+            self.voice_client.stop()
+
+        self.logger.debug(f"Stopped playback (ID: {self.guild_id})")
 
         await self.ui.remove_controls()
 
+    async def close(self) -> None:
+        """Stop playback and cancel the tasks of a player that is not used again"""
+        self.__closed = True
+        await self.stop()
+
+        if self.__transition_worker and not self.__transition_worker.done():
+            self.__transition_worker.cancel()
+
+        self.ui.close()
+
         return song
\ No newline at end of file
@@ -1,6 +1,11 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+import asyncio
+import json
 import logging
 
 import discord
+from discord.ext import commands
 from discord.ui import View
 
 from core import colors
@@ -26,30 +31,101 @@ def player_controls(player) -> View:
 
         return view
 
+def player_state(player) -> Tuple:
+    """Returns everything the now playing screen is rendered from"""
+    song = player.now_playing
+
+    return (
+        song.url if song else None,
+        player.is_playing,
+        bool(player.last_song),
+        player.queue.size() != 0
+    )
+
 class PlayerUI:
-    def __init__(self, channel: discord.TextChannel):
-        self.__channel: discord.TextChannel = channel
-        self.__screen: discord.Message = None
+    def __init__(self, client: commands.Bot, channel_id: int, min_interval: float = 2.0, cache_size: int = 32):
+        self.__client: commands.Bot = client
+        self.__channel_id: int = channel_id
+        # The screen is kept as an ID and rebuilt as a partial message
+        self.__screen_id: int = None
         self.__logger: logging.Logger = logging.getLogger("yaemiko.music.ui")
+        self.__min_interval: float = min_interval
+        self.__cache_size: int = cache_size
+        self.__embeds: OrderedDict = OrderedDict()
+        self.__dirty: asyncio.Event = asyncio.Event()
+        self.__renderer: asyncio.Task = None
+        self.__player = None
+        self.__last_render: float = 0.0
+        self.__last_state: Tuple = None
+        self.renders: int = 0
+        self.skipped: int = 0
 
     @property
-    def channel(self) -> discord.TextChannel:
-        return self.__channel
+    def channel(self) -> Optional[discord.TextChannel]:
+        return self.__client.get_channel(self.__channel_id)
     
     @property
     def logger(self) -> logging.Logger:
         return self.__logger
     
     @property
-    def screen(self) -> discord.Message:
-        return self.__screen
+    def screen(self) -> Optional[discord.PartialMessage]:
+        channel = self.channel
+
+        if not self.__screen_id or not channel:
+            return None
+
+        return channel.get_partial_message(self.__screen_id)
     
     @screen.setter
-    def screen(self, msg: discord.Message):
-        self.__screen = msg
+    def screen(self, msg: Optional[discord.Message]):
+        self.__screen_id = msg.id if msg else None
 
-    async def render_np(self, player):
-        song = player.now_playing
+    @property
+    def memory(self) -> int:
+        """Returns the approximate size of the cached embeds in bytes"""
+        return sum(len(json.dumps(embed.to_dict())) for embed in self.__embeds.values())
+
+    def request_render(self, player) -> None:
+        """Mark the screen as stale, renders are coalesced by a single task"""
+        self.__player = player
+        self.__dirty.set()
+
+        if not self.__renderer or self.__renderer.done():
+            self.__renderer = player.music.spawn(self.__render_loop())
+
+    def close(self) -> None:
+        """Cancel a pending render"""
+        self.__dirty.clear()
+
+        if self.__renderer and not self.__renderer.done():
+            self.__renderer.cancel()
+
+    async def __render_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while self.__dirty.is_set():
+            # Every request made while waiting is folded into the next edit
+            delay = self.__last_render + self.__min_interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            self.__dirty.clear()
+
+            try:
+                await self.render_np(self.__player)
+            except discord.HTTPException as e:
+                self.logger.debug(f"Failed to render screen: {e}")
+
+            self.__last_render = loop.time()
+
+    def embed_for(self, song: Song) -> discord.Embed:
+        """Returns the now playing embed for a song, built once per song"""
+        embed = self.__embeds.get(song.url)
+
+        if embed:
+            self.__embeds.move_to_end(song.url)
+            return embed
 
         embed = discord.Embed(
             colour=colors.pink,
@@ -66,8 +142,31 @@ class PlayerUI:
             text=f"If you like this song, use '/fave' to add this to your favorites!"
         )
 
+        self.__embeds[song.url] = embed
+        if len(self.__embeds) > self.__cache_size:
+            self.__embeds.popitem(last=False)
+
+        return embed
+
+    async def render_np(self, player):
+        song = player.now_playing
+
+        # The channel may have been deleted, the player is evicted soon after
+        if not song or not self.channel:
+            return
+
+        state = player_state(player)
+
+        if self.screen and state == self.__last_state:
+            self.skipped += 1
+            return
+
+        embed = self.embed_for(song)
         view = player_controls(player)
 
+        self.__last_state = state
+        self.renders += 1
+
         if not self.screen:
             self.screen = await self.channel.send(embed=embed, view=view)
             self.logger.debug(f"Created screen for player (ID: {self.screen.guild.id})")
@@ -76,7 +175,7 @@ class PlayerUI:
         self.screen = await self.screen.edit(embed=embed, view=view)
         self.logger.debug(f"Updated screen for player (ID: {self.screen.guild.id})")
 
-    async def send_queue_msg(self, interaction: discord.Interaction, song: Song):
+    async def send_queue_msg(self, interaction: Optional[discord.Interaction], song: Song):
         embed = discord.Embed(
             colour=colors.pink,
             description="Successfully added to queue."
@@ -87,6 +186,47 @@ class PlayerUI:
             icon_url="https://i.imgur.com/rcXLQLG.png"
         )
 
+        if not interaction:
+            await self.channel.send(embed=embed, delete_after=10)
+            return
+
+        try:
+            await interaction.response.send_message(embed=embed, delete_after=10)
+        except Exception as e:
+            self.logger.debug(f"{e}")
+            await self.channel.send(embed=embed, delete_after=10)
+
+    async def send_playlist_msg(self, interaction: Optional[discord.Interaction], title: str, count: int, song: Song):
+        embed = discord.Embed(
+            colour=colors.pink,
+            description=f"Added **{count}** tracks from the playlist to queue."
+        )
+        embed.set_thumbnail(url=song.thumbnail)
+        embed.set_author(
+            name=f"{title}",
+            icon_url="https://i.imgur.com/rcXLQLG.png"
+        )
+
+        if not interaction:
+            await self.channel.send(embed=embed, delete_after=10)
+            return
+
+        try:
+            await interaction.response.send_message(embed=embed, delete_after=10)
+        except Exception as e:
+            self.logger.debug(f"{e}")
+            await self.channel.send(embed=embed, delete_after=10)
+
+    async def send_error(self, interaction: Optional[discord.Interaction], message: str):
+        embed = discord.Embed(
+            colour=colors.red,
+            description=message
+        )
+
+        if not interaction:
+            await self.channel.send(embed=embed, delete_after=10)
+            return
+
         try:
             await interaction.response.send_message(embed=embed, delete_after=10)
         except Exception as e:
@@ -94,12 +234,15 @@ class PlayerUI:
             await self.channel.send(embed=embed, delete_after=10)
 
     async def delete_screen(self):
-        if not self.screen:
+        screen = self.screen
+
+        if not screen:
             return
         
-        self.logger.debug(f"Deleted screen for player (ID: {self.screen.guild.id})")
-        await self.screen.delete()
+        self.logger.debug(f"Deleted screen for player (ID: {screen.guild.id})")
         self.screen = None
+        await screen.delete()
+        self.__last_state = None
 
     async def remove_controls(self):
         if not self.screen:
@@ -108,4 +251,5 @@ class PlayerUI:
         self.screen = await self.screen.edit(
             view=None
         )
+        self.__last_state = None
         self.logger.debug(f"Removed controls for player (ID: {self.screen.guild.id})")
@@ -1,16 +1,97 @@
-from typing import Union
+from collections import deque
+from enum import Enum
+from itertools import islice
+from typing import Iterator, List, Union
+import random
 
 from .song import Song
 
+class LoopMode(Enum):
+    OFF = "off"
+    TRACK = "track"
+    QUEUE = "queue"
+
 class Queue(object):
-    def __init__(self) -> None:
-        self.items = []
+    def __init__(self, history_size: int=50) -> None:
+        self.items     : deque    = deque()
+        self.history   : deque    = deque(maxlen=history_size)
+        self.loop_mode : LoopMode = LoopMode.OFF
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[Song]:
+        return iter(self.items)
+
+    @property
+    def last(self) -> Union[Song, None]:
+        """Returns the most recently played song"""
+        return self.history[-1] if self.history else None
 
     def enqueue(self, item: Song) -> None:
         self.items.append(item)
 
+    def enqueue_front(self, item: Song) -> None:
+        self.items.appendleft(item)
+
     def dequeue(self, index: int=0) -> Union[Song, None]:
-        return self.items.pop(index)
+        if index == 0:
+            return self.items.popleft()
+
+        if index == -1:
+            return self.items.pop()
+
+        item = self.items[index]
+        del self.items[index]
+        return item
+
+    def advance(self, current: Union[Song, None], record: bool=True, repeat: bool=True) -> Song:
+        """Returns the next song to play, honouring the loop mode"""
+        if current and record:
+            self.history.append(current)
+
+        if current and repeat and self.loop_mode == LoopMode.TRACK:
+            return current
+
+        if current and self.loop_mode == LoopMode.QUEUE:
+            self.items.append(current)
+
+        return self.items.popleft()
+
+    def previous(self) -> Song:
+        """Pops the most recently played song from history"""
+        return self.history.pop()
+
+    def move(self, source: int, destination: int) -> Song:
+        """Moves an item to another position in the queue"""
+        item = self.dequeue(source)
+        self.items.insert(destination, item)
+        return item
+
+    def shuffle(self) -> None:
+        # Shuffling a list is O(n), indexing into a deque is not
+        items = list(self.items)
+        random.shuffle(items)
+        self.items.clear()
+        self.items.extend(items)
+
+    def peek(self, index: int=0) -> Union[Song, None]:
+        return self.items[index] if index < len(self.items) else None
+
+    def slice(self, start: int, stop: int) -> List[Song]:
+        """Returns a window of the queue without copying all of it"""
+        return list(islice(self.items, start, stop))
+
+    def replace(self, old: Song, new: Song) -> bool:
+        """Swap an item in place if it is still at the head of the queue"""
+        if self.peek() is not old:
+            return False
+
+        self.items[0] = new
+        return True
+
+    def clear(self) -> None:
+        self.items.clear()
 
     def is_empty(self) -> bool:
         return False if self.size() > 0 else True
@@ -0,0 +1,178 @@
+"""
+This file contains the YouTubeSearch class which turns a
+search query into ranked video candidates by reading the
+ytInitialData JSON embedded in the results page.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlencode
+import json
+import logging
+import re
+import time
+
+import aiohttp
+
+from .track_cache import normalize_query
+
+SEARCH_URL = "https://www.youtube.com/results?"
+# Restricts results to videos, which drops channels, playlists and most shorts
+VIDEO_FILTER = "EgIQAQ=="
+INITIAL_DATA_MARKERS = ("var ytInitialData = ", 'window["ytInitialData"] = ')
+WATCH_ID_PATTERN = re.compile(r"watch\?v=([\w-]{11})")
+
+@dataclass(frozen=True)
+class SearchResult:
+    id: str
+    title: str
+    duration: int
+    channel: str
+    thumbnail: str
+
+    def __str__(self) -> str:
+        return self.title
+
+    @property
+    def url(self) -> str:
+        return "https://www.youtube.com/watch?v=" + self.id
+
+def parse_duration(text: str) -> int:
+    """Converts a 'h:mm:ss' length label to seconds"""
+    seconds = 0
+
+    for part in text.split(":"):
+        if not part.isdigit():
+            return 0
+
+        seconds = seconds * 60 + int(part)
+
+    return seconds
+
+def extract_initial_data(html: str) -> Optional[Dict[str, Any]]:
+    """Decodes the ytInitialData object without scanning past its end"""
+    for marker in INITIAL_DATA_MARKERS:
+        index = html.find(marker)
+
+        if index == -1:
+            continue
+
+        try:
+            data, _ = json.JSONDecoder().raw_decode(html, index + len(marker))
+        except ValueError:
+            continue
+
+        return data
+
+    return None
+
+def iter_video_renderers(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    sections = (
+        data.get("contents", {})
+            .get("twoColumnSearchResultsRenderer", {})
+            .get("primaryContents", {})
+            .get("sectionListRenderer", {})
+            .get("contents", [])
+    )
+
+    for section in sections:
+        for item in section.get("itemSectionRenderer", {}).get("contents", []):
+            # Ads, shelves and shorts use other renderer keys
+            video = item.get("videoRenderer")
+
+            if not video or "reelWatchEndpoint" in video.get("navigationEndpoint", {}):
+                continue
+
+            yield video
+
+def parse_video_renderer(video: Dict[str, Any]) -> Optional[SearchResult]:
+    video_id = video.get("videoId")
+
+    if not video_id:
+        return None
+
+    title = video.get("title", {}).get("runs", [{}])[0].get("text", "")
+    channel = video.get("ownerText", {}).get("runs", [{}])[0].get("text", "")
+    thumbnails = video.get("thumbnail", {}).get("thumbnails", [])
+    length = video.get("lengthText", {}).get("simpleText", "")
+
+    return SearchResult(
+        video_id,
+        title,
+        parse_duration(length),
+        channel,
+        thumbnails[-1].get("url", "") if thumbnails else ""
+    )
+
+def parse_results(html: str, limit: int = 5) -> List[SearchResult]:
+    """Returns up to limit ranked candidates from a results page"""
+    data = extract_initial_data(html)
+
+    if data is None:
+        # Layout changed, fall back to the first watch link on the page
+        match = WATCH_ID_PATTERN.search(html)
+        return [SearchResult(match.group(1), "", 0, "", "")] if match else []
+
+    results = []
+
+    for video in iter_video_renderers(data):
+        result = parse_video_renderer(video)
+
+        if result:
+            results.append(result)
+
+        if len(results) >= limit:
+            break
+
+    return results
+
+class YouTubeSearch:
+    def __init__(
+        self,
+        session: Callable[[], aiohttp.ClientSession],
+        limit: int = 5,
+        max_entries: int = 512,
+        ttl: float = 3600
+    ) -> None:
+        self.__session     : Callable[[], aiohttp.ClientSession] = session
+        self.__limit       : int                                 = limit
+        self.__max_entries : int                                 = max_entries
+        self.__ttl         : float                               = ttl
+        self.__cache       : OrderedDict                         = OrderedDict()
+        self.__logger      : logging.Logger                      = logging.getLogger("yaemiko.music.song")
+        self.hits          : int                                 = 0
+        self.misses        : int                                 = 0
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    async def search(self, query: str) -> List[SearchResult]:
+        """Returns ranked candidates for a query, cached per query"""
+        key = normalize_query(query)
+        entry = self.__cache.get(key)
+
+        if entry and entry[0] > time.monotonic():
+            self.__cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+
+        url = SEARCH_URL + urlencode({"search_query": query, "sp": VIDEO_FILTER})
+
+        async with self.__session().get(url) as response:
+            html = await response.text()
+
+        results = parse_results(html, self.__limit)
+
+        if results:
+            self.__cache[key] = (time.monotonic() + self.__ttl, results)
+            self.__cache.move_to_end(key)
+
+            while len(self.__cache) > self.__max_entries:
+                self.__cache.popitem(last=False)
+
+        self.logger.debug(f"Found {len(results)} candidates for query: '{query}'")
+
+        return results
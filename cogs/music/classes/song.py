@@ -1,12 +1,18 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from typing import TYPE_CHECKING, Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
 
-import asyncio
 import logging
-import json
-import os
+import sys
+import time
 
-import aiohttp
-import yt_dlp
+from .extractor import Extractor
+
+if TYPE_CHECKING:
+    from .search import YouTubeSearch
+
+# Stream URLs without an explicit expiry are assumed to last this long
+DEFAULT_STREAM_TTL = 6 * 60 * 60
 
 @dataclass(frozen=True)
 class Song:
@@ -15,39 +21,109 @@ class Song:
     author: str
     url: str
     thumbnail: str
+    duration: int = 0
+    codec: str = ""
 
     def __str__(self) -> str:
         return self.title
 
-async def fetch_track(query: str, loop: asyncio.BaseEventLoop) -> Song:
+    @property
+    def video_id(self) -> Optional[str]:
+        """Returns the YouTube video ID of the song"""
+        return video_id_from_url(self.url)
+
+    @property
+    def resolved(self) -> bool:
+        """Check if the song has a stream URL, playlist entries get one right before they play"""
+        return bool(self.source)
+
+def song_size(song: Song) -> int:
+    """Returns the approximate memory held by a song in bytes"""
+    return sys.getsizeof(song) + sum(sys.getsizeof(getattr(song, field.name)) for field in fields(song))
+
+def video_id_from_url(url: str) -> Optional[str]:
+    """Extracts the video ID from a YouTube watch URL"""
+    if not url.startswith("https://www.youtube.com/watch?v="):
+        return None
+
+    return parse_qs(urlparse(url).query).get("v", [None])[0]
+
+def playlist_id_from_url(url: str) -> Optional[str]:
+    """Extracts the playlist ID from a YouTube playlist URL"""
+    parsed = urlparse(url)
+
+    # watch?v=...&list=... plays the single video, like noplaylist does
+    if parsed.netloc not in ("www.youtube.com", "youtube.com", "music.youtube.com") or parsed.path != "/playlist":
+        return None
+
+    return parse_qs(parsed.query).get("list", [None])[0]
+
+def song_from_entry(entry: Dict[str, Any]) -> Song:
+    """Builds an unresolved song from a flat playlist entry"""
+    return Song(
+        "",
+        entry.get("title") or "",
+        entry.get("uploader") or entry.get("channel") or "",
+        "https://www.youtube.com/watch?v=" + entry["id"],
+        f"https://i.ytimg.com/vi/{entry['id']}/hqdefault.jpg",
+        int(entry.get("duration") or 0)
+    )
+
+def stream_expires_at(source: str) -> float:
+    """Returns the unix time at which a stream URL stops working"""
+    # Unresolved songs have no stream yet
+    if not source:
+        return 0.0
+
+    parsed = urlparse(source)
+    expire = parse_qs(parsed.query).get("expire")
+
+    # googlevideo also encodes parameters as path segments
+    if not expire and "/expire/" in parsed.path:
+        expire = [parsed.path.split("/expire/")[1].split("/")[0]]
+
+    try:
+        return float(expire[0])
+    except (TypeError, ValueError):
+        return time.time() + DEFAULT_STREAM_TTL
+
+async def fetch_track(query: str, search: "YouTubeSearch", extractor: Extractor, cache=None) -> Song:
         """Process query and returns a song instance"""
         # Logger
         logger = logging.getLogger("yaemiko.music.song")
+
+        if cache:
+            song = cache.get(query)
+
+            if song:
+                logger.debug(f"Cache hit for query: '{query}'")
+                return song
+
+            video_id = cache.get_video_id(query)
+        else:
+            video_id = None
+
+        # Skip search if the query was resolved before
+        if video_id:
+            src = "https://www.youtube.com/watch?v=" + video_id
         # Skip process if user passed a youtube URL
-        if query.startswith("https://www.youtube.com/watch?v="):
+        elif query.startswith("https://www.youtube.com/watch?v="):
             src = query
         # Otherwise, process query to get a yotuube link
         else:
-            search_url = "https://www.youtube.com/results?search_query="
-            for key in query.split():
-                search_url += f"{key}+"
-            search_url = search_url[:-1]
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(search_url) as response:
-                    html = await response.text()
-
-            src = "https://www.youtube.com/"
-            for i in range(html.find("watch?v"), len(html)):
-                if html[i] == '"':
-                    break
-                src += html[i]
-
-        with open(os.path.join(os.path.dirname(__file__), '..', 'ydl_options.json'), 'r') as f:
-            YDL_OPTIONS = json.load(f)
-        
-        ytdl = yt_dlp.YoutubeDL(YDL_OPTIONS)
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(src, download = False))
+            results = await search.search(query)
+
+            if not results:
+                logger.debug(f"No search results for query: '{query}'")
+                return None
+
+            src = results[0].url
+
+        data = await extractor.extract(src)
+
+        if not data:
+            logger.debug(f"Failed to fetch video data for query: '{query}'")
+            return None
 
         logger.debug(f"Fetched video data for query: '{query}'")
 
@@ -56,4 +132,11 @@ async def fetch_track(query: str, loop: asyncio.BaseEventLoop) -> Song:
         url = "https://www.youtube.com/watch?v=" + data["id"]
         thumbnail = data["thumbnail"]
 
-        return Song(data["url"], title, channel, url, thumbnail)
+        duration = int(data.get("duration") or 0)
+
+        song = Song(data["url"], title, channel, url, thumbnail, duration, data.get("acodec") or "")
+
+        if cache:
+            cache.put(query, song)
+
+        return song
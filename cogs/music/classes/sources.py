@@ -0,0 +1,112 @@
+"""
+This file contains audio source wrappers used by the player
+to observe and buffer what the voice client reads from ffmpeg.
+"""
+from collections import deque
+from typing import Callable, Optional
+import threading
+import time
+
+import discord
+
+# Seconds of audio in one frame sent to Discord
+FRAME_LENGTH = 0.02
+# Frame delays above this are treated as a pause rather than lag
+RESYNC_THRESHOLD = 1.0
+
+class MeteredSource(discord.AudioSource):
+    """Wraps a source and reports frame timing and cleanup"""
+    def __init__(
+        self,
+        original: discord.AudioSource,
+        on_first_frame: Optional[Callable[[float], None]] = None,
+        on_lag: Optional[Callable[[float], None]] = None,
+        on_cleanup: Optional[Callable[[], None]] = None
+    ) -> None:
+        self.original       : discord.AudioSource              = original
+        self.on_first_frame : Optional[Callable[[float], None]] = on_first_frame
+        self.on_lag         : Optional[Callable[[float], None]] = on_lag
+        self.on_cleanup     : Optional[Callable[[], None]]      = on_cleanup
+        self.__started      : Optional[float]                   = None
+        self.__frames       : int                               = 0
+
+    def read(self) -> bytes:
+        data = self.original.read()
+        now = time.perf_counter()
+
+        # Called from the audio thread
+        if self.on_first_frame:
+            callback, self.on_first_frame = self.on_first_frame, None
+            callback(now)
+
+        if self.on_lag:
+            if self.__started is None:
+                self.__started = now
+
+            lag = now - (self.__started + self.__frames * FRAME_LENGTH)
+
+            # A long gap is a pause, discord.py restarts its frame clock as well
+            if lag > RESYNC_THRESHOLD:
+                self.__started, self.__frames, lag = now, 0, 0.0
+
+            self.__frames += 1
+            self.on_lag(max(0.0, lag))
+
+        return data
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self) -> None:
+        self.original.cleanup()
+
+        if self.on_cleanup:
+            callback, self.on_cleanup = self.on_cleanup, None
+            callback()
+
+class PrebufferedSource(discord.AudioSource):
+    """Wraps a source and reads its first frames ahead of playback"""
+    def __init__(self, original: discord.AudioSource, max_frames: int = 50) -> None:
+        self.original   : discord.AudioSource = original
+        self.max_frames : int                 = max_frames
+        self.__buffer   : deque               = deque()
+        self.__stopped  : threading.Event     = threading.Event()
+
+    @property
+    def buffered(self) -> int:
+        """Returns the number of frames waiting in the buffer"""
+        return len(self.__buffer)
+
+    @property
+    def buffered_bytes(self) -> int:
+        """Returns the size of the frames waiting in the buffer"""
+        return sum(map(len, list(self.__buffer)))
+
+    def prefill(self) -> int:
+        """Blocking, reads frames until the buffer is full, the source ends or stop is called"""
+        while len(self.__buffer) < self.max_frames and not self.__stopped.is_set():
+            data = self.original.read()
+
+            if not data:
+                break
+
+            self.__buffer.append(data)
+
+        return len(self.__buffer)
+
+    def stop(self) -> None:
+        """Makes a running prefill return after the frame it is reading"""
+        self.__stopped.set()
+
+    def read(self) -> bytes:
+        if self.__buffer:
+            return self.__buffer.popleft()
+
+        return self.original.read()
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self) -> None:
+        self.__buffer.clear()
+        self.original.cleanup()
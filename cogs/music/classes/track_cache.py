@@ -0,0 +1,213 @@
+"""
+This file contains the TrackCache class which keeps resolved
+track metadata in memory (and optionally on disk) so repeated
+queries do not have to hit YouTube again.
+"""
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+import logging
+import sqlite3
+import time
+
+from .song import Song, stream_expires_at, video_id_from_url
+
+# Seconds between deletes of expired rows on disk
+PRUNE_INTERVAL = 3600
+
+def normalize_query(query: str) -> str:
+    """Returns the cache key for a search query"""
+    return " ".join(query.lower().split())
+
+class TrackCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        query_ttl: float = 604800,
+        expiry_margin: float = 600,
+        path: Optional[str] = None
+    ) -> None:
+        self.__tracks        : OrderedDict                 = OrderedDict()
+        self.__queries       : OrderedDict                 = OrderedDict()
+        self.__max_entries   : int                         = max_entries
+        self.__query_ttl     : float                       = query_ttl
+        self.__expiry_margin : float                       = expiry_margin
+        self.__conn          : Optional[sqlite3.Connection] = None
+        # One thread owns the connection, writes never block the event loop
+        self.__executor      : Optional[ThreadPoolExecutor] = None
+        self.__pruned_at     : float                       = 0
+        self.__logger        : logging.Logger              = logging.getLogger("yaemiko.music.cache")
+        self.hits            : int                         = 0
+        self.misses          : int                         = 0
+
+        if path:
+            self.__open(path)
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Returns cache counters"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tracks": len(self.__tracks),
+            "queries": len(self.__queries)
+        }
+
+    def get(self, query: str) -> Optional[Song]:
+        """Returns a cached song with a usable stream URL"""
+        video_id = self.get_video_id(query)
+        entry = self.__tracks.get(video_id) if video_id else None
+
+        if entry and entry[1] > time.time():
+            self.__tracks.move_to_end(video_id)
+            self.hits += 1
+            return entry[0]
+
+        if entry:
+            # Stream URL has expired, metadata alone is not playable
+            self.__tracks.pop(video_id)
+
+        self.misses += 1
+        return None
+
+    def get_video_id(self, query: str) -> Optional[str]:
+        """Returns the video ID a query resolved to, if known"""
+        video_id = video_id_from_url(query)
+        if video_id:
+            return video_id
+
+        key = normalize_query(query)
+        entry = self.__queries.get(key)
+
+        if not entry:
+            return None
+
+        if entry[1] <= time.time():
+            self.__queries.pop(key)
+            return None
+
+        self.__queries.move_to_end(key)
+        return entry[0]
+
+    def put(self, query: str, song: Song) -> None:
+        """Store a resolved song for a query"""
+        video_id = song.video_id
+        if not video_id:
+            return
+
+        now = time.time()
+        expires_at = stream_expires_at(song.source) - self.__expiry_margin
+
+        if expires_at > now:
+            self.__insert(self.__tracks, video_id, (song, expires_at))
+
+        if not video_id_from_url(query):
+            self.__insert(self.__queries, normalize_query(query), (video_id, now + self.__query_ttl))
+
+        if self.__conn:
+            self.__submit(self.__persist, self.__conn, query, song, expires_at, now)
+
+    def invalidate(self, video_id: str) -> None:
+        """Drop the cached stream for a video, keeping query mappings"""
+        self.__tracks.pop(video_id, None)
+
+        if self.__conn:
+            self.__submit(self.__delete, self.__conn, video_id)
+
+    def close(self) -> None:
+        """Close the persistent store once the queued writes are done"""
+        if not self.__conn:
+            return
+
+        # Runs after the queued writes on the store thread, without blocking the event loop
+        self.__executor.submit(self.__conn.close)
+        self.__executor.shutdown(wait=False)
+        self.__conn = None
+        self.logger.debug(f"Closed track cache (hits: {self.hits}, misses: {self.misses})")
+
+    def __insert(self, table: OrderedDict, key: str, value: Tuple) -> None:
+        table[key] = value
+        table.move_to_end(key)
+
+        while len(table) > self.__max_entries:
+            table.popitem(last=False)
+
+    # Persistence
+    def __submit(self, func: Callable, *args) -> None:
+        self.__executor.submit(func, *args).add_done_callback(self.__log_failure)
+
+    def __log_failure(self, job: Future) -> None:
+        if job.exception():
+            self.logger.error(f"Failed to write track cache: {job.exception()}")
+
+    def __open(self, path: str) -> None:
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="track-cache")
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+
+        with self.__conn:
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "video_id TEXT PRIMARY KEY, source TEXT, title TEXT, author TEXT, "
+                "url TEXT, thumbnail TEXT, duration INTEGER, codec TEXT, expires_at REAL, updated_at REAL)"
+            )
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS queries ("
+                "query TEXT PRIMARY KEY, video_id TEXT, expires_at REAL)"
+            )
+
+        self.__load()
+
+    def __prune(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM tracks WHERE expires_at <= ?", (now,))
+        conn.execute("DELETE FROM queries WHERE expires_at <= ?", (now,))
+        self.__pruned_at = now
+
+    def __load(self) -> None:
+        with self.__conn:
+            self.__prune(self.__conn, time.time())
+
+        rows = self.__conn.execute(
+            "SELECT video_id, source, title, author, url, thumbnail, duration, codec, expires_at FROM tracks "
+            "ORDER BY updated_at DESC LIMIT ?", (self.__max_entries,)
+        ).fetchall()
+
+        for video_id, source, title, author, url, thumbnail, duration, codec, expires_at in reversed(rows):
+            self.__tracks[video_id] = (Song(source, title, author, url, thumbnail, duration, codec), expires_at)
+
+        rows = self.__conn.execute(
+            "SELECT query, video_id, expires_at FROM queries "
+            "ORDER BY expires_at DESC LIMIT ?", (self.__max_entries,)
+        ).fetchall()
+
+        for query, video_id, expires_at in reversed(rows):
+            self.__queries[query] = (video_id, expires_at)
+
+        self.logger.debug(f"Loaded {len(self.__tracks)} tracks and {len(self.__queries)} queries from disk")
+
+    # Store thread, jobs get the connection they were queued for as close() clears it
+    def __delete(self, conn: sqlite3.Connection, video_id: str) -> None:
+        with conn:
+            conn.execute("DELETE FROM tracks WHERE video_id=?", (video_id,))
+
+    def __persist(self, conn: sqlite3.Connection, query: str, song: Song, expires_at: float, now: float) -> None:
+        with conn:
+            # Stream URLs expire within hours, keep the tables from growing all run
+            if now - self.__pruned_at > PRUNE_INTERVAL:
+                self.__prune(conn, now)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (song.video_id, song.source, song.title, song.author, song.url, song.thumbnail, song.duration, song.codec, expires_at, now)
+            )
+
+            if not video_id_from_url(query):
+                conn.execute(
+                    "INSERT OR REPLACE INTO queries VALUES (?, ?, ?)",
+                    (normalize_query(query), song.video_id, now + self.__query_ttl)
+                )
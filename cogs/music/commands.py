@@ -2,7 +2,6 @@
 A module for playing music in voice channels
 """
 # Standard imports
-import asyncio
 import json
 import logging
 import os
@@ -17,7 +16,10 @@ from core import colors
 from core.message import send_error_message, send_notif, Responses
 
 # Package iports
+from .classes.governor import CapacityExceeded
+from .classes.idle import IdleScheduler
 from .classes.music import Music
+from .classes.queue import LoopMode
 
 # init dir
 if not os.path.exists('playlists'):
@@ -52,50 +54,73 @@ class MusicCommands(commands.Cog):
             "propagate": False
         }
 
+        self.client.logging_config["loggers"]["yaemiko.music.cache"] = {
+            "handlers": ["debugHandler", "fileHandler"],
+            "level": "DEBUG",
+            "propagate": False
+        }
+
+        self.client.logging_config["loggers"]["yaemiko.music.extractor"] = {
+            "handlers": ["debugHandler", "fileHandler"],
+            "level": "DEBUG",
+            "propagate": False
+        }
+
         self.client.configure_logger()
         self.logger = logging.getLogger("yaemiko.music")
 
-        self.music  = Music()
-        
         with open(os.path.join(os.path.dirname(__file__), 'settings.json'), 'r') as f:
             self.MUSIC_SETTINGS = json.load(f)
 
-    async def auto_disconnect(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState) -> None:
-        """Handles automatic disconnection of the bot from voice"""
-        # Settings
-        feautre_enabled = self.MUSIC_SETTINGS.get("enable_auto_disconnect")
-        timeout = self.MUSIC_SETTINGS.get("auto_disconnect_timeout")
+        self.music  = Music(self.client, self.MUSIC_SETTINGS)
+        self.idle   = IdleScheduler(self.MUSIC_SETTINGS.get("auto_disconnect_timeout", 180), self.auto_disconnect)
+
+    async def cog_load(self) -> None:
+        """Imports favorites left in the old playlists folder"""
+        if not self.client.is_primary:
+            return
+
+        folder = self.MUSIC_SETTINGS.get("favorites", {}).get("migrate_from", "playlists")
+        await self.music.favorites.migrate(folder)
+
+    async def cog_unload(self) -> None:
+        """Releases shared music resources when the cog is removed"""
+        self.idle.close()
+        self.music.close()
 
-        if not feautre_enabled:
+    async def auto_disconnect(self, guild_id: int) -> None:
+        """Disconnects the bot from a voice channel it was left alone in"""
+        guild = self.client.get_guild(guild_id)
+        # Ignore if the bot is no longer connected
+        if not guild or not guild.voice_client:
             return
 
-        guild = self.client.get_guild(member.guild.id)
-        # Ignore if the bost is not connected
-        if not guild.voice_client:
+        # Someone may have joined as the timer fired
+        if not self.is_alone(guild.voice_client.channel):
+            self.logger.debug(f"Finished timer in guild: ({guild.id}), aborting auto-disconnect")
             return
 
-        self.logger.debug(f"Started auto-disconnect timer in guild: ({guild.id}).")
-        # Delay before the bot disconnects
-        await asyncio.sleep(timeout)
+        player = self.music.get_player(guild.id)
 
-        user_count = len(guild.voice_client.channel.members)
-        if user_count < 2:
-            player = self.music.get_player(guild.id)
+        if player:
             channel = player.channel
+            self.music.close_player(guild.id)
 
-            if player:
-                self.music.close_player(guild.id)
-
+        if player and channel:
             await channel.send(
                 embed=discord.Embed(
                     colour=colors.pink,
                     description=Responses.bot_disconnect
                 )
             )
-            await guild.voice_client.disconnect()
-            self.logger.debug(f"Disconnected from voice in guild: ({guild.id})")
-        else:
-            self.logger.debug(f"Finished timer in guild: ({guild.id}), aborting auto-disconnect")
+
+        await guild.voice_client.disconnect()
+        self.logger.debug(f"Disconnected from voice in guild: ({guild.id})")
+
+    @staticmethod
+    def is_alone(channel: discord.VoiceChannel) -> bool:
+        """Check if no one but bots is left in a voice channel"""
+        return not any(not member.bot for member in channel.members)
 
     @commands.Cog.listener()
     async def on_ready(self) -> None:
@@ -105,9 +130,27 @@ class MusicCommands(commands.Cog):
     @commands.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState) -> None:
         """Called when a user updates their voice state"""
-        # For updates thaat do not come from the bot
-        if member != self.client.user:
-            await self.auto_disconnect(member, before, after)
+        if not self.MUSIC_SETTINGS.get("enable_auto_disconnect"):
+            return
+
+        voice_client = member.guild.voice_client
+
+        if not voice_client or (member == self.client.user and not after.channel):
+            self.idle.cancel(member.guild.id)
+            return
+
+        channel = voice_client.channel
+
+        # Only joins and leaves of the bot's channel can change whether it is alone
+        if member != self.client.user and before.channel == after.channel:
+            return
+        if member != self.client.user and channel not in (before.channel, after.channel):
+            return
+
+        if self.is_alone(channel):
+            self.idle.arm(member.guild.id)
+        else:
+            self.idle.cancel(member.guild.id)
 
     @app_commands.command(name="play", description="Connect to voice and play something.")
     @app_commands.describe(query="Title or URL of audio to be played")
@@ -137,11 +180,26 @@ class MusicCommands(commands.Cog):
             )
             return
 
+        new_player = not player
+
+        if new_player:
+            try:
+                player = self.music.create_player(await self.client.get_context(interaction))
+            except CapacityExceeded as e:
+                self.logger.debug(f"{e} (ID: {interaction.guild_id})")
+                await interaction.response.send_message(
+                    embed=discord.Embed(
+                        colour=colors.red,
+                        description=Responses.music_node_full
+                    ),
+                    delete_after=10
+                )
+                return
+
         if not interaction.guild.voice_client:
             await interaction.user.voice.channel.connect()
 
-        if not player:
-            player = self.music.create_player(await self.client.get_context(interaction))
+        if new_player:
             await interaction.response.send_message(
                 embed=discord.Embed(
                     description=Responses.bot_on_connect.format(
@@ -154,6 +212,61 @@ class MusicCommands(commands.Cog):
 
         await player.play(query, interaction)
 
+    @app_commands.command(name="musicstats", description="Show music node capacity and cache statistics")
+    async def musicstats(self, interaction: discord.Interaction) -> None:
+        """Displays how much streaming capacity this node has left"""
+        headroom = self.music.governor.headroom
+        cache = self.music.track_cache.stats
+        extractor = self.music.extractor.stats
+        lifecycle = self.music.stats
+
+        embed = discord.Embed(
+            colour=colors.pink,
+            title="🎶 Music node status"
+        )
+        embed.add_field(
+            name="Streams",
+            value=f"{headroom['streams']}/{headroom['max_streams']} ({headroom['free_streams']} free, {headroom['waiting']} waiting)"
+        )
+        embed.add_field(
+            name="ffmpeg processes",
+            value=f"{headroom['processes']}/{headroom['max_processes']}"
+        )
+        embed.add_field(
+            name="Encode lag",
+            value=f"{headroom['encode_lag_ms']:.2f} ms (limit {headroom['max_encode_lag_ms']:.0f} ms)"
+        )
+        embed.add_field(
+            name="Players",
+            value=f"{lifecycle['players']} ({headroom['rejected']} rejected, {lifecycle['evicted']} evicted)"
+        )
+        embed.add_field(
+            name="Player memory",
+            value=f"~{lifecycle['per_player'] / 1024:.1f} KiB each, {lifecycle['memory'] / 1024:.1f} KiB total"
+        )
+        embed.add_field(
+            name="Track cache",
+            value=f"{cache['hits']} hits / {cache['misses']} misses"
+        )
+        embed.add_field(
+            name="Extractor",
+            value=f"{extractor['pending']} pending, {extractor['timeouts']} timeouts"
+        )
+        embed.add_field(
+            name="Idle timers",
+            value=f"{self.idle.pending} armed, {self.idle.fired} fired"
+        )
+
+        player = self.music.get_player(interaction.guild_id)
+        if player:
+            transitions = player.transition_stats
+            embed.add_field(
+                name="Track transitions",
+                value=f"{transitions['avg']:.0f} ms avg, {transitions['max']:.0f} ms max"
+            )
+
+        await interaction.response.send_message(embed=embed, delete_after=30)
+
     @app_commands.command(name="queue", description="View the list of queued songs")
     async def queue(self, interaction: discord.Interaction) -> None:
         """Displays the list of queued songs/tracks"""
@@ -197,24 +310,21 @@ class MusicCommands(commands.Cog):
             colour=colors.pink,
             description=f"🎶 Up Next in **{player.channel.name}**"
         )
+        head = queue.peek()
         embed.set_thumbnail(
-            url=queue.items[0].thumbnail
+            url=head.thumbnail
         )
         embed.set_author(
-                name=f"{queue.items[0].title}",
+                name=f"{head.title}",
                 icon_url="https://i.imgur.com/rcXLQLG.png"
             )
 
         if queue.size() > 1:
             songs = ""
-            overflow = 0
+            overflow = max(0, queue.size() - 9)
 
-            for index, song in enumerate(queue.items[1:], 2):
-                if index < 10:
-                    songs += f"\n `{index}` {song.title}"
-                    continue
-                
-                overflow += 1
+            for index, song in enumerate(queue.slice(1, 9), 2):
+                songs += f"\n `{index}` {song.title}"
 
             if overflow > 0:
                 songs += f"\n\n...and **` {overflow} `** more songs."
@@ -268,7 +378,17 @@ class MusicCommands(commands.Cog):
             )
             return
 
-        song = queue.dequeue(index - 1)
+        song = player.remove_song(index - 1)
+
+        if not song:
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    colour=colors.red,
+                    description=Responses.music_invalid_position
+                ),
+                delete_after=10
+            )
+            return
 
         embed = discord.Embed(
             colour=colors.pink,
@@ -284,6 +404,147 @@ class MusicCommands(commands.Cog):
 
         await interaction.response.send_message(embed=embed, delete_after=10)
 
+    @app_commands.command(name="move", description="Moves a song to another position in the queue")
+    @app_commands.describe(index="The ID of the song to move", position="The new ID of the song")
+    async def move(self, interaction: discord.Interaction, index: int, position: int) -> None:
+        """Moves a song/track to another position in the queue"""
+        player = self.music.get_player(interaction.guild.id)
+
+        if not player:
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    colour=colors.red,
+                    description=Responses.music_no_player
+                ),
+                delete_after=10
+            )
+            return
+
+        if interaction.channel != player.channel:
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    colour=colors.red,
+                    description=Responses.music_wrong_channel.format(
+                        channel_name=player.channel.name
+                    )
+                ),
+                delete_after=10
+            )
+            return
+
+        song = player.move_song(index - 1, position - 1)
+
+        if not song:
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    colour=colors.red,
+                    description=Responses.music_invalid_position
+                ),
+                delete_after=10
+            )
+            return
+
+        await interaction.response.send_message(
+            embed=discord.Embed(
+                colour=colors.pink,
+                description=Responses.music_queue_moved.format(
+                    title=song.title,
+                    position=position
+                )
+            ),
+            delete_after=10
+        )
+
+    @app_commands.command(name="shuffle", description="Shuffles the queue")
+    async def shuffle(self, interaction: discord.Interaction) -> None:
+        """Shuffles the queued songs/tracks"""
+        player = self.music.get_player(interaction.guild.id)
+
+        if not player:
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    colour=colors.red,
+                    description=Responses.music_no_player
+                ),
+                delete_after=10
+            )
+            return
+
+        if interaction.channel != player.channel:
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    colour=colors.red,
+                    description=Responses.music_wrong_channel.format(
+                        channel_name=player.channel.name
+                    )
+                ),
+                delete_after=10
+            )
+            return
+
+        if player.queue.is_empty():
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    colour=colors.red,
+                    description=Responses.music_empty_queue
+                ),
+                delete_after=10
+            )
+            return
+
+        player.shuffle()
+
+        await interaction.response.send_message(
+            embed=discord.Embed(
+                colour=colors.pink,
+                description=Responses.music_queue_shuffled
+            ),
+            delete_after=10
+        )
+
+    @app_commands.command(name="loop", description="Sets the loop mode of the player")
+    @app_commands.describe(mode="off, track or queue")
+    @app_commands.choices(mode=[
+        app_commands.Choice(name=mode.value, value=mode.value) for mode in LoopMode
+    ])
+    async def loop_mode(self, interaction: discord.Interaction, mode: str) -> None:
+        """Sets whether the current song or the whole queue repeats"""
+        player = self.music.get_player(interaction.guild.id)
+
+        if not player:
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    colour=colors.red,
+                    description=Responses.music_no_player
+                ),
+                delete_after=10
+            )
+            return
+
+        if interaction.channel != player.channel:
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    colour=colors.red,
+                    description=Responses.music_wrong_channel.format(
+                        channel_name=player.channel.name
+                    )
+                ),
+                delete_after=10
+            )
+            return
+
+        player.set_loop_mode(LoopMode(mode))
+
+        await interaction.response.send_message(
+            embed=discord.Embed(
+                colour=colors.pink,
+                description=Responses.music_loop_mode.format(
+                    mode=mode
+                )
+            ),
+            delete_after=10
+        )
+
     @app_commands.command(name="leave", description="Leave current voice channel")
     async def leave(self, interaction: discord.Interaction) -> None:
         """Makes the bot disconnect from the user's voice channel"""
@@ -397,61 +658,65 @@ class MusicCommands(commands.Cog):
             )
             return
 
-        with open(f"playlists/{ctx.author.id}.txt", 'a', encoding="utf8") as file:
-            file.write(f"{song.get_title()}\n")
+        await self.music.favorites.add(ctx.author.id, song)
 
         await send_notif(
             ctx,
             Responses.music_player_fav_add.format(
-                title=song.get_title()
+                title=song.title
             )
         )
 
     @commands.command()
     async def unfave(self, ctx: commands.Context, i: int) -> None:
         """Removes the specified song from favorites"""
-        i = i - 1
-        with open(f"playlists/{ctx.author.id}.txt", 'r', encoding="utf8") as file:
-            songs = file.read().splitlines()
+        favorite = await self.music.favorites.remove(ctx.author.id, i) if i >= 1 else None
 
-        playlist = ""
-        for index, song in enumerate(songs):
-            if index == i:
-                await send_notif(
-                    ctx,
-                    Responses.music_player_fav_rm.format(
-                        title=song
-                    )
-                )
-            else:
-                playlist = playlist + f"{song}\n"
+        if not favorite:
+            await send_error_message(
+                ctx,
+                Responses.msuic_player_fav_invalid
+            )
+            return
 
-        with open(f"playlists/{ctx.author.id}.txt", 'w', encoding="utf8") as file:
-            file.write(playlist)
+        await send_notif(
+            ctx,
+            Responses.music_player_fav_rm.format(
+                title=favorite.title
+            )
+        )
 
     @commands.command(aliases=['faves', 'favelist', 'favlist'])
-    async def favorites(self, ctx: commands.Context) -> None:
+    async def favorites(self, ctx: commands.Context, page: int = 1) -> None:
         """Display a list of songs/tracks added to favorites"""
         pref = self.client.prefix(self.client, ctx.message)
+        per_page = self.MUSIC_SETTINGS.get("favorites", {}).get("page_size", 10)
 
-        try:
-            with open(f"playlists/{ctx.author.id}.txt", 'r', encoding="utf8") as file:
-                songs = file.read().splitlines()
-
-            playlist = ""
-            for index, song in enumerate(songs, start=1):
-                playlist = playlist + f"`{index}` {song}\n"
+        page = max(1, page)
+        favorites, total = await self.music.favorites.page(ctx.author.id, page - 1, per_page)
 
-            playlist = "None" if playlist == "" else playlist
-
-            embed = discord.Embed(colour=colors.pink, title="❤️ Liked Songs", description=playlist)
-            embed.set_footer(text=f"Use `{pref}unfave <id>` to remove an item from your favorites.")
-            await ctx.send(embed=embed)
-        except FileNotFoundError:
+        if not total:
             await send_error_message(
                 ctx,
                 Responses.music_player_no_fav
             )
+            return
+
+        pages = -(-total // per_page)
+
+        playlist = ""
+        # Numbers stay with a favorite when others are removed
+        for favorite in favorites:
+            playlist = playlist + f"`{favorite.seq}` {favorite.title}\n"
+
+        playlist = "None" if playlist == "" else playlist
+
+        embed = discord.Embed(colour=colors.pink, title="❤️ Liked Songs", description=playlist)
+        embed.set_footer(
+            text=f"Page {page}/{pages} • Use `{pref}favorites <page>` to browse "
+                 f"and `{pref}unfave <id>` to remove an item from your favorites."
+        )
+        await ctx.send(embed=embed)
 
     @commands.command(aliases=['playfaves', 'pl', 'pref'])
     async def playliked(self, ctx: commands.Context, number=None):
@@ -463,68 +728,100 @@ class MusicCommands(commands.Cog):
             )
             return
 
-        if not ctx.voice_client:
-            await ctx.invoke(self.client.get_command('join'))
-
         player = self.music.get_player(ctx.guild.id)
 
-        if not player:
-            player = self.music.create_player(ctx, "nowplaying")
-
-        if ctx.channel != player.get_channel():
+        if player and ctx.channel != player.channel:
             await send_error_message(
                 ctx,
                 Responses.music_wrong_channel.format(
-                    channel_name=player.get_channel().name
+                    channel_name=player.channel.name
                 )
             )
             return
 
-        with open(f"playlists/{ctx.author.id}.txt", 'r', encoding="utf8") as file:
-            songs = file.read().splitlines()
-
         if number:
             try:
-                number = int(number) - 1
+                favorite = await self.music.favorites.get(ctx.author.id, int(number)) if int(number) >= 1 else None
             except ValueError:
-                self.logger.debug(f"Failed to convert {number} to integer type")
+                favorite = None
+
+            if not favorite:
+                self.logger.debug(f"No favorite numbered {number} for user: {ctx.author.id}")
                 await send_error_message(
                     ctx,
                     Responses.msuic_player_fav_invalid
                 )
                 return
 
-            await player.play(songs[number])
+            songs = [favorite]
+        else:
+            songs = await self.music.favorites.all(ctx.author.id)
+
+            if not songs:
+                await send_error_message(
+                    ctx,
+                    Responses.music_player_no_fav
+                )
+                return
+
+        if not player:
+            try:
+                player = self.music.create_player(ctx)
+            except CapacityExceeded as e:
+                self.logger.debug(f"{e} (ID: {ctx.guild.id})")
+                await send_error_message(
+                    ctx,
+                    Responses.music_node_full
+                )
+                return
+
+        if not ctx.voice_client:
+            await ctx.author.voice.channel.connect()
+
+        if number:
+            song = songs[0]
+            resolved = await player.play(song.query)
+
+            if resolved and not song.video_id:
+                await self.music.favorites.resolve(ctx.author.id, song.seq, resolved)
             return
 
-        desc = "Processing, please wait..."
-        msg = await player.get_channel().send(
+        msg = await player.channel.send(
             embed=discord.Embed(
                 colour=colors.pink,
                 title="❤️ Playing songs that you like",
-                description=desc
+                description="Processing, please wait..."
             )
         )
 
         desc = ""
-        for index, song in enumerate(songs, start=1):
-            desc += f"`{index}` {song}\n"
+        for song in songs[:10]:
+            desc += f"`{song.seq}` {song}\n"
 
+        if len(songs) > 10:
+            desc += f"\n...and **` {len(songs) - 10} `** more songs."
+
+        async def on_progress(resolved: int, total: int) -> None:
             await msg.edit(
                 embed=discord.Embed(
                     colour=colors.pink,
-                    title=f"❤️ Playing songs that you like ({index}/{len(songs)})",
+                    title=f"❤️ Playing songs that you like ({resolved}/{total})",
                     description=desc
                 )
             )
-            await player.play(song, silent=True)
 
-        await msg.edit(
-            embed=discord.Embed(
-                colour=colors.pink,
-                title="❤️ Playing songs that you like",
-                description=desc
+        try:
+            resolved = await player.play_many([song.query for song in songs], on_progress)
+        except CapacityExceeded as e:
+            self.logger.debug(f"{e} (ID: {ctx.guild.id})")
+            await msg.delete()
+            await send_error_message(
+                ctx,
+                Responses.music_node_full
             )
-        )
+            return
 
-        await ctx.invoke(self.client.get_command("nowplaying"))
+        # Legacy title-only favorites keep the video they resolved to
+        for song, track in zip(songs, resolved):
+            if track and not song.video_id:
+                await self.music.favorites.resolve(ctx.author.id, song.seq, track)
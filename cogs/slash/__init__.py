@@ -1,4 +1,8 @@
 from .slash import Slash
 
+# Application commands only, members arrive with the interaction
+INTENTS = ()
+MEMBER_CACHE = ()
+
 async def setup(client):
     await client.add_cog(Slash(client))
@@ -1,4 +1,8 @@
 from .spam import AntiSpam
 
+# Moderation acts on member IDs, no member cache or members intent is needed
+INTENTS = ("guild_messages", "message_content")
+MEMBER_CACHE = ()
+
 async def setup(client):
     await client.add_cog(AntiSpam(client))
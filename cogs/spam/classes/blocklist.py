@@ -0,0 +1,217 @@
+"""
+This file contains the Blocklists class which matches messages
+against every blocked word, link and invite of a guild at once.
+
+The patterns of a guild are compiled into one Aho-Corasick
+automaton, so a message is scanned in a single pass however many
+patterns there are. Changes only mark the automaton stale, it is
+rebuilt by the next scan.
+"""
+from collections import Counter, OrderedDict, deque
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+import time
+import unicodedata
+
+from core.model import GuildStore
+
+KINDS = ("word", "link", "invite")
+INVITE_HOSTS = ("discord.gg/", "discord.com/invite/", "discordapp.com/invite/")
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).casefold()
+
+def expand(kind: str, pattern: str) -> List[str]:
+    """Returns the strings a pattern is matched as, an invite of * blocks every invite"""
+    pattern = normalize(pattern.strip())
+
+    if kind == "link":
+        for prefix in ("https://", "http://", "www."):
+            if pattern.startswith(prefix):
+                pattern = pattern[len(prefix):]
+        return [pattern]
+
+    if kind == "invite":
+        code = "" if pattern == "*" else pattern.rsplit("/", 1)[-1]
+        return [host + code for host in INVITE_HOSTS]
+
+    return [pattern]
+
+class Automaton:
+    """Aho-Corasick automaton over a list of strings"""
+    def __init__(self, needles: List[str]) -> None:
+        self.needles : List[str]            = needles
+        self.goto    : List[Dict[str, int]] = [{}]
+        self.fail    : List[int]            = [0]
+        # node -> indices of the needles ending there, fail chain included
+        self.out     : List[Tuple[int, ...]] = [()]
+
+        for i, needle in enumerate(needles):
+            node = 0
+
+            for char in needle:
+                following = self.goto[node].get(char)
+
+                if following is None:
+                    following = self.goto[node][char] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+
+                node = following
+
+            self.out[node] += (i,)
+
+        # Breadth first, a node's fail link always points to a shallower node
+        queue = deque(self.goto[0].values())
+
+        while queue:
+            node = queue.popleft()
+
+            for char, following in self.goto[node].items():
+                queue.append(following)
+
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+
+                self.fail[following] = self.goto[fallback].get(char, 0)
+                self.out[following] += self.out[self.fail[following]]
+
+    def __len__(self) -> int:
+        return len(self.goto)
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yields (end index, needle index) of every match"""
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+
+            node = goto[node].get(char, 0)
+
+            for needle in out[node]:
+                yield i, needle
+
+class GuildBlocklist:
+    def __init__(self, patterns: List[Tuple[str, str]]) -> None:
+        self.patterns   : List[Tuple[str, str]]  = patterns
+        self.automaton  : Optional[Automaton]    = None
+        # needle index -> (kind, pattern) it was expanded from
+        self.sources    : List[Tuple[str, str]]  = []
+        self.matches    : Counter                = Counter()
+        self.scans      : int                    = 0
+        self.scan_time  : float                  = 0.0
+        self.max_scan   : float                  = 0.0
+        self.build_time : float                  = 0.0
+
+    def build(self) -> Automaton:
+        start = time.perf_counter()
+        needles = []
+        self.sources = []
+
+        for kind, pattern in self.patterns:
+            for needle in expand(kind, pattern):
+                if needle:
+                    needles.append(needle)
+                    self.sources.append((kind, pattern))
+
+        self.automaton = Automaton(needles)
+        self.build_time = time.perf_counter() - start
+        return self.automaton
+
+    def scan(self, text: str) -> List[Tuple[str, str]]:
+        """Returns the (kind, pattern) pairs found in a message"""
+        if not self.patterns:
+            return []
+
+        automaton = self.automaton or self.build()
+        start = time.perf_counter()
+        text = normalize(text)
+        found = {}
+
+        for end, needle in automaton.finditer(text):
+            kind, pattern = self.sources[needle]
+
+            # Words only count on their own, not inside other words
+            if kind == "word":
+                begin = end - len(automaton.needles[needle]) + 1
+                if (begin > 0 and text[begin - 1].isalnum()) or (end + 1 < len(text) and text[end + 1].isalnum()):
+                    continue
+
+            found[(kind, pattern)] = None
+
+        elapsed = time.perf_counter() - start
+        self.scans += 1
+        self.scan_time += elapsed
+        self.max_scan = max(self.max_scan, elapsed)
+        self.matches.update(found.keys())
+
+        return list(found)
+
+class Blocklists:
+    def __init__(self, store: GuildStore, max_guilds: int = 1000, max_patterns: int = 5000) -> None:
+        self.__store        : GuildStore     = store
+        self.__max_guilds   : int            = max_guilds
+        self.__max_patterns : int            = max_patterns
+        self.__guilds       : OrderedDict    = OrderedDict()
+        self.__logger       : logging.Logger = logging.getLogger("yaemiko.spam")
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    @property
+    def max_patterns(self) -> int:
+        return self.__max_patterns
+
+    async def get(self, guild_id: int) -> GuildBlocklist:
+        """Returns the blocklist of a guild, loaded from the store on first use"""
+        blocklist = self.__guilds.get(guild_id)
+
+        if blocklist is not None:
+            self.__guilds.move_to_end(guild_id)
+            return blocklist
+
+        blocklist = GuildBlocklist(await self.__store.get_blocklist(guild_id))
+
+        # Another message of the guild may have loaded it meanwhile
+        blocklist = self.__guilds.setdefault(guild_id, blocklist)
+
+        while len(self.__guilds) > self.__max_guilds:
+            self.__guilds.popitem(last=False)
+
+        return blocklist
+
+    async def add(self, guild_id: int, kind: str, pattern: str) -> bool:
+        """Adds a pattern, False if it was already blocked"""
+        blocklist = await self.get(guild_id)
+
+        if (kind, pattern) in blocklist.patterns:
+            return False
+
+        await self.__store.add_blocked(guild_id, kind, pattern)
+        blocklist.patterns.append((kind, pattern))
+        blocklist.automaton = None
+        return True
+
+    async def remove(self, guild_id: int, kind: str, pattern: str) -> bool:
+        """Removes a pattern, False if it was not blocked"""
+        blocklist = await self.get(guild_id)
+
+        if (kind, pattern) not in blocklist.patterns:
+            return False
+
+        await self.__store.remove_blocked(guild_id, kind, pattern)
+        blocklist.patterns.remove((kind, pattern))
+        blocklist.automaton = None
+        return True
+
+    def invalidate(self, guild_id: Optional[int] = None) -> None:
+        """Drop the cached blocklist of a guild, or of every guild"""
+        if guild_id is None:
+            self.__guilds.clear()
+        else:
+            self.__guilds.pop(guild_id, None)
@@ -0,0 +1,211 @@
+"""
+This file contains the RaidDetector class which spots the same or
+nearly the same message posted by many authors of a guild.
+
+Every message is reduced to a handful of keys: a hash of its
+normalized text, links and attachments, and the bands of its
+SimHash. Messages within 7 bits of each other share at least one
+band, so near-duplicates meet under a common key without ever
+being compared to each other.
+"""
+from collections import OrderedDict, deque
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Any, Deque, Dict, Iterable, List, Tuple
+import re
+import struct
+import unicodedata
+
+BANDS = 8
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+MAX_DISTANCE = BANDS - 1
+MASK64 = (1 << 64) - 1
+
+LINK = re.compile(r"https?://(?:www\.)?([^\s/?#>]+)([^\s?#>]*)", re.IGNORECASE)
+NOISE = re.compile(r"<a?:\w+:\d+>|<[@#&!]+\d+>|[\u200b-\u200f\u2060\ufeff]")
+DIGITS = re.compile(r"\d+")
+SHINGLE = 4
+
+def hash64(data: str) -> int:
+    return int.from_bytes(blake2b(data.encode("utf-8"), digest_size=8).digest(), "little")
+
+def normalize(content: str) -> Tuple[str, List[str]]:
+    """Returns the comparable text of a message and the links it contains
+
+    Case, mentions, custom emoji, invisible characters and numbers are
+    dropped, raid scripts vary those to get past exact matching.
+    """
+    content = unicodedata.normalize("NFKC", content).lower()
+    links = sorted(f"{host}{path.rstrip('/')}" for host, path in LINK.findall(content))
+    text = DIGITS.sub("#", NOISE.sub(" ", LINK.sub(" ", content)))
+    return " ".join(text.split()), links
+
+@lru_cache(maxsize=8192)
+def lanes(token: str) -> int:
+    """Spells the hash of a token as 64 UTF-16 '0'/'1' characters read as one integer
+
+    The index never leaves the process, so the salted builtin hash is
+    stable enough here. Common shingles repeat a lot, hence the cache.
+    """
+    return int.from_bytes(format(hash(token) & MASK64, "064b").encode("utf-16-le"), "little")
+
+def simhash(tokens: List[str]) -> int:
+    """Each bit is set when most token hashes have it set
+
+    Adding up the lanes of every token counts all 64 columns at
+    once, each in its own 16 bit lane.
+    """
+    total = sum(map(lanes, tokens))
+    threshold = ord("0") * len(tokens) + len(tokens) / 2
+    counts = struct.unpack("<64H", total.to_bytes(128, "little"))
+    return int("".join("1" if count > threshold else "0" for count in counts), 2)
+
+def fingerprint(content: str, attachments: Iterable[Tuple[str, int]] = (), min_length: int = 80) -> Tuple[int, List[Tuple[int, int]]]:
+    """Returns the SimHash and index keys of a message, no keys when it is too short to tell apart from chatter"""
+    text, links = normalize(content)
+    attachments = sorted(f"{name.lower()}:{size}" for name, size in attachments)
+
+    if len(text) < min_length and not links and not attachments:
+        return 0, []
+
+    keys = [(BANDS, hash64("\n".join((text, *links, *attachments))))]
+
+    # Character shingles move few bits when a word is added or changed, lanes hold up to 1337 tokens.
+    # Raids vary invite codes and paths, only the host of a link counts as near
+    tokens = list({text[i:i + SHINGLE] for i in range(min(len(text) - SHINGLE + 1, 128))})
+    tokens.extend({link.split("/", 1)[0] for link in links[:16]})
+
+    if len(tokens) < 3:
+        return 0, keys
+
+    h = simhash(tokens)
+    keys.extend((band, h >> band * BAND_BITS & BAND_MASK) for band in range(BANDS))
+
+    return h, keys
+
+class GuildIndex:
+    """Keys seen in one guild, in buckets of one second"""
+    def __init__(self) -> None:
+        self.buckets : Deque[Tuple[int, Dict[Tuple[int, int], List[Tuple[int, Any]]]]] = deque()
+        # key -> author -> messages within the window
+        self.authors : Dict[Tuple[int, int], Dict[int, int]] = {}
+        # SimHash of the first message under a band key, later ones must be near it
+        self.anchors : Dict[Tuple[int, int], int]            = {}
+        # author -> second they were flagged, one report per raid
+        self.flagged : Dict[int, int]                        = {}
+        self.size    : int                                   = 0
+
+    def expire(self, oldest: int) -> None:
+        if not self.buckets or self.buckets[0][0] >= oldest:
+            return
+
+        while self.buckets and self.buckets[0][0] < oldest:
+            self.drop()
+
+        if self.flagged:
+            self.flagged = {author: second for author, second in self.flagged.items() if second >= oldest}
+
+    def drop(self) -> None:
+        """Forgets the oldest bucket"""
+        _, bucket = self.buckets.popleft()
+
+        for key, entries in bucket.items():
+            authors = self.authors[key]
+
+            for author, _ in entries:
+                authors[author] -= 1
+                if not authors[author]:
+                    del authors[author]
+
+            if not authors:
+                del self.authors[key]
+                self.anchors.pop(key, None)
+
+            self.size -= len(entries)
+
+class RaidDetector:
+    def __init__(self, max_guilds: int = 1000, max_entries: int = 5000) -> None:
+        self.__max_guilds  : int         = max_guilds
+        self.__max_entries : int         = max_entries
+        self.__guilds      : OrderedDict = OrderedDict()
+        self.flagged       : int         = 0
+
+    def __len__(self) -> int:
+        return len(self.__guilds)
+
+    def observe(
+        self,
+        guild_id: int,
+        author_id: int,
+        now: float,
+        simhash: int,
+        keys: List[Tuple[int, int]],
+        threshold: int,
+        window: float,
+        ref: Any = None
+    ) -> Dict[int, List[Any]]:
+        """Records a message, returns authors that just joined a group of threshold or more with their refs"""
+        index = self.__guilds.get(guild_id)
+
+        if index is None:
+            index = self.__guilds[guild_id] = GuildIndex()
+
+            while len(self.__guilds) > self.__max_guilds:
+                self.__guilds.popitem(last=False)
+        else:
+            self.__guilds.move_to_end(guild_id)
+
+        second = int(now)
+        index.expire(second - int(window))
+
+        if not index.buckets or index.buckets[-1][0] != second:
+            index.buckets.append((second, {}))
+
+        # Fixed memory, a flood ages out the oldest second early
+        while index.size + len(keys) > self.__max_entries and len(index.buckets) > 1:
+            index.drop()
+
+        # The current second alone is full, let the rest of it through unseen
+        if index.size + len(keys) > self.__max_entries:
+            return {}
+
+        bucket = index.buckets[-1][1]
+        raiders: Dict[int, List[Any]] = {}
+
+        for key in keys:
+            if key[0] != BANDS:
+                anchor = index.anchors.setdefault(key, simhash)
+
+                # A shared band alone is a weak match for short texts
+                if (anchor ^ simhash).bit_count() > MAX_DISTANCE:
+                    continue
+
+            bucket.setdefault(key, []).append((author_id, ref))
+            authors = index.authors.setdefault(key, {})
+            authors[author_id] = authors.get(author_id, 0) + 1
+            index.size += 1
+
+            if len(authors) < threshold:
+                continue
+
+            # The whole group is flagged once, after that only the author can be new
+            for author in authors if len(authors) == threshold else (author_id,):
+                if author not in index.flagged:
+                    index.flagged[author] = second
+                    raiders[author] = []
+
+        if not raiders:
+            return raiders
+
+        self.flagged += len(raiders)
+
+        # Only runs when a group trips, gathers the messages of the new raiders
+        for _, old in index.buckets:
+            for key in keys:
+                for author, ref in old.get(key, ()):
+                    refs = raiders.get(author)
+                    if refs is not None and ref is not None and ref not in refs:
+                        refs.append(ref)
+
+        return raiders
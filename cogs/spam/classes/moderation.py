@@ -0,0 +1,142 @@
+"""
+This file contains the ModerationQueue class which runs anti-spam
+enforcement off the gateway event handlers.
+"""
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Set, Tuple
+import asyncio
+import logging
+
+@dataclass(frozen=True)
+class ModAction:
+    guild_id: int
+    member_id: int
+    channel_id: int
+    name: str
+    kind: str = "softban"
+    # (channel id, message id) of the messages that tripped the window
+    messages: Tuple[Tuple[int, int], ...] = ()
+
+    @property
+    def key(self) -> Tuple:
+        """Actions with the same key are deduped, deletes are per message"""
+        if self.kind == "delete":
+            return (self.guild_id, self.member_id, self.messages)
+
+        return (self.guild_id, self.member_id)
+
+class ModerationQueue:
+    def __init__(
+        self,
+        execute: Callable[[ModAction], Awaitable[None]],
+        workers: int = 4,
+        guild_interval: float = 1.0,
+        max_pending: int = 1000
+    ) -> None:
+        self.__execute        : Callable[[ModAction], Awaitable[None]] = execute
+        self.__worker_count   : int                          = workers
+        self.__guild_interval : float                        = guild_interval
+        self.__max_pending    : int                          = max_pending
+        # A guild is in here while it is waiting in the ready queue or held by a worker
+        self.__actions        : Dict[int, Deque[ModAction]]  = {}
+        self.__keys           : Set[Tuple]                   = set()
+        self.__next_at        : Dict[int, float]             = {}
+        self.__ready          : asyncio.Queue                = None
+        self.__workers        : List[asyncio.Task]           = []
+        self.__logger         : logging.Logger               = logging.getLogger("yaemiko.spam")
+        self.done             : int                          = 0
+        self.failed           : int                          = 0
+        self.deduped          : int                          = 0
+        self.dropped          : int                          = 0
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    @property
+    def pending(self) -> int:
+        """Returns the number of queued and running actions"""
+        return len(self.__keys)
+
+    def enqueue(self, action: ModAction) -> bool:
+        """Queue an action, False if the same one is already pending or the queue is full"""
+        key = action.key
+
+        if key in self.__keys:
+            self.deduped += 1
+            return False
+
+        if len(self.__keys) >= self.__max_pending:
+            self.dropped += 1
+            self.logger.warning(f"Moderation queue full, dropped {action.kind} of {action.member_id} in guild: ({action.guild_id}).")
+            return False
+
+        self.__start()
+        self.__keys.add(key)
+
+        actions = self.__actions.get(action.guild_id)
+
+        if actions is None:
+            actions = self.__actions[action.guild_id] = deque()
+            self.__ready.put_nowait(action.guild_id)
+
+        actions.append(action)
+        return True
+
+    def __start(self) -> None:
+        if self.__workers:
+            return
+
+        self.__ready = asyncio.Queue()
+        self.__workers = [
+            asyncio.get_running_loop().create_task(self.__work())
+            for _ in range(self.__worker_count)
+        ]
+
+    async def __work(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            guild_id = await self.__ready.get()
+            delay = self.__next_at.get(guild_id, 0) - loop.time()
+
+            # Come back once the guild may act again, meanwhile serve other guilds
+            if delay > 0:
+                loop.call_later(delay, self.__ready.put_nowait, guild_id)
+                continue
+
+            actions = self.__actions[guild_id]
+            action = actions.popleft()
+
+            try:
+                await self.__execute(action)
+                self.done += 1
+            except Exception as e:
+                self.failed += 1
+                self.logger.exception(f"Moderation {action.kind} of {action.member_id} failed in guild: ({guild_id}): {e}")
+
+            self.__keys.discard(action.key)
+            self.__next_at[guild_id] = loop.time() + self.__guild_interval
+
+            # Back of the queue, a raided guild takes turns with the others
+            if actions:
+                self.__ready.put_nowait(guild_id)
+            else:
+                del self.__actions[guild_id]
+                self.__prune(loop.time())
+
+    def __prune(self, now: float) -> None:
+        """Forget spacing of guilds that may act again, once they pile up"""
+        if len(self.__next_at) > 2 * len(self.__actions) + 64:
+            self.__next_at = {guild: at for guild, at in self.__next_at.items() if at > now}
+
+    def close(self) -> None:
+        """Drop every pending action and stop the workers"""
+        for worker in self.__workers:
+            worker.cancel()
+
+        self.__workers.clear()
+        self.__actions.clear()
+        self.__keys.clear()
+        self.__next_at.clear()
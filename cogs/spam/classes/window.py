@@ -0,0 +1,81 @@
+"""
+This file contains the SlidingWindow class which counts recent
+messages of every (guild, author) pair for the anti-spam cog.
+"""
+from collections import OrderedDict, deque
+from typing import Any, Deque, List, Tuple
+
+class SlidingWindow:
+    def __init__(self, max_authors: int = 50000, idle_ttl: float = 300) -> None:
+        self.__max_authors : int         = max_authors
+        self.__idle_ttl    : float       = idle_ttl
+        # (guild_id, author_id) -> (timestamp, ref) pairs, least recently active first
+        self.__windows     : OrderedDict = OrderedDict()
+        self.evicted       : int         = 0
+
+    def __len__(self) -> int:
+        return len(self.__windows)
+
+    def hit(self, guild_id: int, author_id: int, now: float, limit: int, window: float, ref: Any = None) -> bool:
+        """Records a message at monotonic time now, True once more than limit fall within window seconds
+
+        ref is kept alongside the timestamp and handed back by reset, keep it small
+        """
+        key = (guild_id, author_id)
+        windows = self.__windows
+        timestamps: Deque[Tuple[float, Any]] = windows.get(key)
+
+        # Only limit + 1 timestamps can ever matter, which bounds memory per author
+        if timestamps is None:
+            timestamps = windows[key] = deque(maxlen=limit + 1)
+        else:
+            windows.move_to_end(key)
+
+            if timestamps.maxlen != limit + 1:
+                timestamps = windows[key] = deque(timestamps, maxlen=limit + 1)
+
+        timestamps.append((now, ref))
+
+        # Timestamps are appended in order, so expired ones are always on the left
+        expired = now - window
+        while timestamps and timestamps[0][0] <= expired:
+            timestamps.popleft()
+
+        # With a zero window even this message is gone, nothing is left to track
+        if not timestamps:
+            del windows[key]
+
+        self.__evict(now)
+
+        return len(timestamps) > limit
+
+    def reset(self, guild_id: int, author_id: int) -> List[Any]:
+        """Forgets an author, returns the refs of the messages still in the window"""
+        timestamps = self.__windows.pop((guild_id, author_id), None)
+        return [ref for _, ref in timestamps or () if ref is not None]
+
+    def __evict(self, now: float) -> None:
+        """Drops authors over capacity and idle ones, oldest activity first"""
+        windows = self.__windows
+
+        while len(windows) > self.__max_authors:
+            windows.popitem(last=False)
+            self.evicted += 1
+
+        idle = now - self.__idle_ttl
+
+        # The front is the least recently active author, stop at the first active one
+        while windows:
+            key = next(iter(windows))
+            timestamps = windows[key]
+
+            if timestamps and timestamps[-1][0] > idle:
+                break
+
+            del windows[key]
+            self.evicted += 1
+
+    @property
+    def stats(self) -> Tuple[int, int]:
+        """Returns the number of tracked authors and evictions so far"""
+        return len(self.__windows), self.evicted
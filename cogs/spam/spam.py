@@ -1,18 +1,37 @@
 import discord
 import asyncio
+import time
 
-from datetime import datetime
 from discord.ext import commands
 
 from core.logger import console_log
 from core import colors
+from .classes.blocklist import KINDS, Blocklists
+from .classes.fingerprint import RaidDetector, fingerprint
+from .classes.moderation import ModAction, ModerationQueue
+from .classes.window import SlidingWindow
 
 settings = {
     "message_pool": "5",
-    "trigger_time_delta": "1500"
+    "trigger_time_delta": "1500",
+    "action": "softban",       # or "purge" to bulk delete the spam instead
+    "raid_authors": "0",       # authors posting the same message that make a raid, 0 disables
+    "raid_window": "10000"
 }
 
-messages = {}
+engine = {
+    "max_authors": 50000,   # authors tracked across all guilds
+    "idle_ttl": 300,        # seconds before a quiet author is forgotten
+    "threshold_ttl": 30,    # seconds before guild thresholds are read again
+    "workers": 4,           # moderation actions running at once
+    "guild_interval": 1.0,  # seconds between moderation actions in one guild
+    "max_pending": 1000,    # moderation actions queued before new ones are dropped
+    "raid_guilds": 1000,    # guilds with a raid index
+    "raid_entries": 5000,   # fingerprint keys indexed per guild
+    "raid_min_length": 80,  # shorter texts without links or files are not fingerprinted
+    "blocklist_guilds": 1000,    # guilds with a compiled blocklist
+    "blocklist_patterns": 5000   # blocked words, links and invites per guild
+}
 
 async def send_basic_response(channel, message, color):
     await channel.send(embed = discord.Embed(description = message, colour = color))
@@ -21,6 +40,35 @@ class AntiSpam(commands.Cog):
     def __init__(self, client):
         self.client = client
         self.config = client.config
+        self.window = SlidingWindow(engine["max_authors"], engine["idle_ttl"])
+        self.raids = RaidDetector(engine["raid_guilds"], engine["raid_entries"])
+        self.blocklists = Blocklists(client.store, engine["blocklist_guilds"], engine["blocklist_patterns"])
+        self.moderation = ModerationQueue(self.enforce, engine["workers"], engine["guild_interval"], engine["max_pending"])
+        # guild id -> ((message_pool, trigger window, action, raid_authors, raid window), expiry)
+        self.thresholds = {}
+
+        self.client.add_ipc_handler("blocklist", self.on_ipc_blocklist)
+
+    async def cog_unload(self):
+        self.moderation.close()
+
+    def get_thresholds(self, guild_id, now):
+        """Returns cached thresholds of a guild, windows in seconds"""
+        cached = self.thresholds.get(guild_id)
+
+        if cached and cached[1] > now:
+            return cached[0]
+
+        config = self.config[guild_id]
+        message_pool = config.getint(__name__, 'message_pool', fallback=int(settings['message_pool']))
+        trigger_time_delta = config.getint(__name__, 'trigger_time_delta', fallback=int(settings['trigger_time_delta']))
+        action = config.get(__name__, 'action', fallback=settings['action'])
+        raid_authors = config.getint(__name__, 'raid_authors', fallback=int(settings['raid_authors']))
+        raid_window = config.getint(__name__, 'raid_window', fallback=int(settings['raid_window']))
+
+        thresholds = (message_pool, trigger_time_delta / 1000, action, raid_authors, raid_window / 1000)
+        self.thresholds[guild_id] = (thresholds, now + engine["threshold_ttl"])
+        return thresholds
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -35,49 +83,184 @@ class AntiSpam(commands.Cog):
         guild = message.guild
         author = message.author
 
-        config = self.config[guild.id]
+        # ignore if bot or outside of a guild
+        if self.client.user == author or not guild:
+            return
+
+        now = time.monotonic()
+        message_pool, trigger_window, action, raid_authors, raid_window = self.get_thresholds(guild.id, now)
+        ref = (message.channel.id, message.id)
+
+        # one pass over the message for every blocked pattern of the guild
+        blocklist = await self.blocklists.get(guild.id)
+        if blocklist.scan(message.content):
+            self.moderation.enqueue(ModAction(
+                guild.id,
+                author.id,
+                message.channel.id,
+                author.nick if author.nick else author.name,
+                "delete",
+                (ref,)
+            ))
+
+        # kick condition
+        if self.window.hit(guild.id, author.id, now, message_pool, trigger_window, ref):
+            # the next messages of this user start a new window
+            spam = self.window.reset(guild.id, author.id)
+
+            # enforcement runs on the moderation workers, repeated triggers are dropped there
+            self.moderation.enqueue(ModAction(
+                guild.id,
+                author.id,
+                message.channel.id,
+                author.nick if author.nick else author.name,
+                action,
+                tuple(spam)
+            ))
 
-        # init params
-        trigger_time_delta = config.getint(__name__, 'trigger_time_delta')
-        message_pool = config.getint(__name__, 'message_pool')
-        current_time = datetime.now().timestamp() * 1000
+        if raid_authors:
+            self.detect_raid(message, now, raid_authors, raid_window, ref)
 
-        # ignore if bot
-        if self.client.user == message.author:
+    def detect_raid(self, message, now, raid_authors, raid_window, ref):
+        """Flags authors posting the same or nearly the same message"""
+        guild = message.guild
+        simhash, keys = fingerprint(
+            message.content,
+            [(attachment.filename, attachment.size) for attachment in message.attachments],
+            engine["raid_min_length"]
+        )
+
+        if not keys:
             return
 
-        # init message pool
-        if not messages.get(author.id, None):
-            messages[author.id] = []
+        raiders = self.raids.observe(guild.id, message.author.id, now, simhash, keys, raid_authors, raid_window, ref)
 
-        # add new message to pool
-        messages[author.id].append(Message(message, current_time))
+        if raiders:
+            console_log(f"ANTISPAM: Raid by {len(raiders)} more users in {guild.name}.")
 
-        # kick condition
-        if len(messages[author.id]) > message_pool:
-            console_log(f"ANTISPAM: Kick condition met for {author.nick if author.nick else author.name} in {guild.name}.")
-            try:
-                if message.guild.get_member(message.author.id):
-                    # soft ban user, deleting messages in the process
-                    await message.guild.ban(message.author, reason="Spamming")
-                    await asyncio.sleep(1)
-                    await message.guild.unban(message.author)
-                    await send_basic_response(message.channel, f"Kicked **{message.author.nick if message.author.nick else message.author.name}** for spamming.", colors.pink)
-            except:
-                console_log(f"ANTISPAM: Could not kick user {author.id}.")
-                console_log(f"ANTISPAM: Could not delete spam messages by {author.id}.")
-                await send_basic_response(message.channel, f"Detected spam by **{message.author.nick if message.author.nick else message.author.name}** but could not kick user.", colors.red)
-            finally:
-                messages[author.id] = []
-
-        # removed expired messages from pool
-        for msg in messages[author.id]:
-            time_delta = current_time - msg.time
-
-            if time_delta > trigger_time_delta:
-                messages[author.id].remove(msg)
-
-class Message:
-    def __init__(self, message, time):
-        self.message = message
-        self.time = time
+        for member_id, spam in raiders.items():
+            # Earlier raiders are not cached, they are named by mention
+            author = message.author
+
+            self.moderation.enqueue(ModAction(
+                guild.id,
+                member_id,
+                message.channel.id,
+                (author.nick if author.nick else author.name) if member_id == author.id else f"<@{member_id}>",
+                # near duplicates can still be chatter, raids only remove the messages
+                "purge",
+                tuple(spam)
+            ))
+
+    async def enforce(self, action):
+        """Runs one moderation action, called by the moderation workers"""
+        guild = self.client.get_guild(action.guild_id)
+        channel = guild.get_channel(action.channel_id) if guild else None
+
+        if not channel:
+            return
+
+        if action.kind == "delete":
+            await self.purge(guild, channel, action, f"Removed a blocked message by **{action.name}**.")
+            return
+
+        console_log(f"ANTISPAM: Kick condition met for {action.name} in {guild.name}.")
+
+        if action.kind == "purge":
+            await self.purge(guild, channel, action)
+            return
+
+        # Banned by ID, the member does not have to be in the cache
+        member = discord.Object(id=action.member_id)
+
+        try:
+            # soft ban user, deleting messages in the process
+            await guild.ban(member, reason="Spamming")
+            await asyncio.sleep(1)
+            await guild.unban(member)
+            await send_basic_response(channel, f"Kicked **{action.name}** for spamming.", colors.pink)
+        except Exception:
+            console_log(f"ANTISPAM: Could not kick user {action.member_id}.")
+            await send_basic_response(channel, f"Detected spam by **{action.name}** but could not kick user.", colors.red)
+
+    async def purge(self, guild, channel, action, notice=None):
+        """Bulk deletes the messages of an action, one request per channel"""
+        by_channel = {}
+
+        for channel_id, message_id in action.messages:
+            by_channel.setdefault(channel_id, []).append(discord.Object(id=message_id))
+
+        try:
+            for channel_id, spam in by_channel.items():
+                target = guild.get_channel(channel_id)
+
+                if target:
+                    await target.delete_messages(spam, reason="Spamming")
+
+            await send_basic_response(channel, notice or f"Deleted spam by **{action.name}**.", colors.pink)
+        except Exception:
+            console_log(f"ANTISPAM: Could not delete spam messages by {action.member_id}.")
+            await send_basic_response(channel, f"Detected spam by **{action.name}** but could not delete it.", colors.red)
+
+    async def on_ipc_blocklist(self, message):
+        """Another cluster changed a blocklist, it is loaded again on the next message"""
+        self.blocklists.invalidate(message.get("guild_id"))
+
+    def blocklist_changed(self, guild_id):
+        if self.client.ipc:
+            self.client.ipc.broadcast("blocklist", guild_id=guild_id)
+
+    @commands.group(invoke_without_command=True)
+    @commands.has_permissions(manage_messages=True)
+    async def blocklist(self, ctx):
+        """Shows the blocked patterns with their match counts and scan time"""
+        blocklist = await self.blocklists.get(ctx.guild.id)
+        patterns = sorted(blocklist.patterns, key=lambda pattern: -blocklist.matches[pattern])
+        average = blocklist.scan_time / blocklist.scans if blocklist.scans else 0
+
+        embed = discord.Embed(
+            title = "Blocklist",
+            description = "\n".join(
+                f"`{kind}` {discord.utils.escape_markdown(pattern)} - {blocklist.matches[(kind, pattern)]} matches" for kind, pattern in patterns[:25]
+            ) or "Nothing is blocked.",
+            colour = colors.pink
+        )
+        embed.add_field(name="Patterns", value=f"{len(patterns)}")
+        embed.add_field(name="Scans", value=f"{blocklist.scans}")
+        embed.add_field(name="Scan time", value=f"{average * 1e6:.1f} µs avg, {blocklist.max_scan * 1e6:.1f} µs max")
+
+        await ctx.send(embed=embed)
+
+    @blocklist.command(name="add")
+    @commands.has_permissions(manage_messages=True)
+    async def blocklist_add(self, ctx, kind, *, pattern):
+        """Blocks a word, link or invite (* for every invite)"""
+        kind = kind.lower()
+
+        if kind not in KINDS:
+            await send_basic_response(ctx.channel, f"Kind must be one of: {', '.join(KINDS)}.", colors.red)
+            return
+
+        blocklist = await self.blocklists.get(ctx.guild.id)
+
+        if len(blocklist.patterns) >= self.blocklists.max_patterns:
+            await send_basic_response(ctx.channel, f"The blocklist is full ({self.blocklists.max_patterns} patterns).", colors.red)
+            return
+
+        if not await self.blocklists.add(ctx.guild.id, kind, pattern):
+            await send_basic_response(ctx.channel, f"`{kind}` **{discord.utils.escape_markdown(pattern)}** is already blocked.", colors.red)
+            return
+
+        self.blocklist_changed(ctx.guild.id)
+        await send_basic_response(ctx.channel, f"Blocked `{kind}` **{discord.utils.escape_markdown(pattern)}**.", colors.pink)
+
+    @blocklist.command(name="remove")
+    @commands.has_permissions(manage_messages=True)
+    async def blocklist_remove(self, ctx, kind, *, pattern):
+        """Unblocks a word, link or invite"""
+        if not await self.blocklists.remove(ctx.guild.id, kind.lower(), pattern):
+            await send_basic_response(ctx.channel, f"`{kind}` **{discord.utils.escape_markdown(pattern)}** is not blocked.", colors.red)
+            return
+
+        self.blocklist_changed(ctx.guild.id)
+        await send_basic_response(ctx.channel, f"Unblocked `{kind.lower()}` **{discord.utils.escape_markdown(pattern)}**.", colors.pink)
@@ -0,0 +1,154 @@
+"""
+This file contains the AccessControl service which answers
+access level checks from per-guild maps kept in memory.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+import asyncio
+import logging
+
+from core.cluster import ClusterIPC
+from core.model import GuildStore
+
+class AccessControl:
+    def __init__(self, store: GuildStore, max_guilds: int = 1024, ipc: ClusterIPC = None) -> None:
+        self.__store      : GuildStore     = store
+        self.__ipc        : ClusterIPC     = ipc
+        self.__max_guilds : int            = max_guilds
+        # guild_id -> {uid: access}, only users with a non-zero level are stored
+        self.__guilds     : OrderedDict    = OrderedDict()
+        self.__loading    : Dict[int, asyncio.Future] = {}
+        # Writes and invalidations that land while a guild is being loaded
+        self.__writes     : Dict[int, Dict[int, int]] = {}
+        self.__stale      : Set[int]       = set()
+        self.__logger     : logging.Logger = logging.getLogger("yaemiko.access")
+        self.hits         : int            = 0
+        self.misses       : int            = 0
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    async def __levels(self, guild_id: int) -> Dict[int, int]:
+        """Returns the access map of a guild, loading it with one query on first use"""
+        levels = self.__guilds.get(guild_id)
+
+        if levels is not None:
+            self.__guilds.move_to_end(guild_id)
+            self.hits += 1
+            return levels
+
+        # Concurrent checks in a cold guild share one load
+        loading = self.__loading.get(guild_id)
+        if loading:
+            return await asyncio.shield(loading)
+
+        self.misses += 1
+        loading = asyncio.get_running_loop().create_future()
+        self.__loading[guild_id] = loading
+
+        try:
+            levels = await self.__store.get_guild_access(guild_id)
+        except Exception as e:
+            loading.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            loading.exception()
+            raise
+        finally:
+            self.__loading.pop(guild_id, None)
+            writes = self.__writes.pop(guild_id, {})
+            stale = guild_id in self.__stale
+            self.__stale.discard(guild_id)
+
+        # The query may have run before a write that finished meanwhile
+        for uid, access in writes.items():
+            if access:
+                levels[uid] = access
+            else:
+                levels.pop(uid, None)
+
+        loading.set_result(levels)
+
+        # Invalidated mid-load, answer these checks but load again next time
+        if stale:
+            return levels
+
+        self.__guilds[guild_id] = levels
+
+        while len(self.__guilds) > self.__max_guilds:
+            self.__guilds.popitem(last=False)
+
+        return levels
+
+    def cached_access(self, guild_id: int, uid: int) -> Optional[int]:
+        """Returns the access level without I/O, None if the guild is not loaded"""
+        levels = self.__guilds.get(guild_id)
+        return None if levels is None else levels.get(uid, 0)
+
+    async def get_access(self, guild_id: int, uid: int) -> int:
+        return (await self.__levels(guild_id)).get(uid, 0)
+
+    async def get_many(self, guild_id: int, uids: Iterable[int]) -> Dict[int, int]:
+        """Returns the access level of several users of a guild"""
+        uids = list(uids)
+        levels = self.__guilds.get(guild_id)
+
+        # A cold guild is answered with one indexed query for just these users
+        if levels is None:
+            found = await self.__store.get_access_many(guild_id, uids)
+            return {uid: found.get(uid, 0) for uid in uids}
+
+        self.__guilds.move_to_end(guild_id)
+        self.hits += 1
+        return {uid: levels.get(uid, 0) for uid in uids}
+
+    async def compare_access(self, guild_id: int, uid_a: int, uid_b: int) -> int:
+        """Returns the user with the higher access level, uid_b on ties"""
+        levels = await self.get_many(guild_id, (uid_a, uid_b))
+        return uid_a if levels[uid_a] > levels[uid_b] else uid_b
+
+    async def has_access(self, guild_id: int, uid: int, level: int) -> bool:
+        return await self.get_access(guild_id, uid) >= level
+
+    async def set_access(self, guild_id: int, uid: int, access: int) -> None:
+        """Write-through update, a level of 0 removes the user"""
+        if access:
+            await self.__store.update(guild_id, uid, access)
+        else:
+            await self.__store.delete_user(guild_id, uid)
+
+        # Other clusters drop their copy instead of serving a stale level
+        if self.__ipc:
+            self.__ipc.broadcast("access", guild_id=guild_id)
+
+        if guild_id in self.__loading:
+            self.__writes.setdefault(guild_id, {})[uid] = access
+
+        levels = self.__guilds.get(guild_id)
+
+        if levels is None:
+            return
+
+        if access:
+            levels[uid] = access
+        else:
+            levels.pop(uid, None)
+
+    def invalidate(self, guild_id: Optional[int] = None) -> None:
+        """Drop the cached map of a guild, or of every guild"""
+        if guild_id is None:
+            self.__guilds.clear()
+            self.__stale.update(self.__loading)
+        else:
+            self.__guilds.pop(guild_id, None)
+
+            if guild_id in self.__loading:
+                self.__stale.add(guild_id)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "guilds": len(self.__guilds),
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -1,14 +1,27 @@
 import os
+import aiohttp
 import discord
+import importlib
 import json
 import logging
 
 from discord.ext import commands
 from logging.config import dictConfig
+from typing import Any, Awaitable, Callable, Dict, Tuple
 
-class YaeMiko(commands.Bot):
+from core.access import AccessControl
+from core.cluster import ClusterIPC
+from core.config import GuildConfigs
+from core.memory import rss_bytes
+from core.model import GuildStore
+
+class YaeMiko(commands.AutoShardedBot):
     def __init__(self, **kwargs) -> None:
         self.version = kwargs.get("version")
+        self.cluster_id: int = kwargs.get("cluster_id")
+        self.ipc: ClusterIPC = kwargs.get("ipc")
+        self.__ipc_handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[None]]] = {}
+        self.baseline_rss: int = 0
 
         with open("settings.json", 'r') as f:
             self.settings = json.load(f)
@@ -16,6 +29,11 @@ class YaeMiko(commands.Bot):
         with open("logging_config.json", 'r') as f:
             self.logging_config = json.load(f)
 
+        # Clusters would truncate each other's log file
+        if self.cluster_id is not None:
+            file_handler = self.logging_config["handlers"]["fileHandler"]
+            file_handler["filename"] = file_handler["filename"].replace(".log", f"-{self.cluster_id}.log")
+
         self.configure_logger()
 
         if self.settings.get("test_guild_id"):
@@ -24,20 +42,146 @@ class YaeMiko(commands.Bot):
             self.test_guild = None
 
         self.logger = logging.getLogger("yaemiko")
+
+        config_settings = self.settings.get("config", {})
+        self.config = GuildConfigs(
+            config_settings.get("folder", "config"),
+            check_interval=config_settings.get("check_interval", 1.0),
+            flush_interval=config_settings.get("flush_interval", 5.0)
+        )
         self.modules = kwargs.get('modules')
+        self.__http_session: aiohttp.ClientSession = None
+        self.store: GuildStore = None
+        self.access: AccessControl = None
+
+        budget = self.settings.get("memory_budget", {})
+
+        if budget.get("enabled", True):
+            intents, member_cache_flags = self.build_intents()
+            cache_options = {
+                "member_cache_flags": member_cache_flags,
+                "chunk_guilds_at_startup": budget.get("chunk_guilds_at_startup", False),
+                "max_messages": budget.get("max_messages") or None
+            }
+        else:
+            intents, cache_options = discord.Intents().all(), {}
 
+        # Without shard IDs discord.py asks the gateway how many shards to run
         super().__init__(
             command_prefix=self.prefix,
             help_command=None,
-            intents=discord.Intents().all()
+            intents=intents,
+            shard_ids=kwargs.get("shard_ids"),
+            shard_count=kwargs.get("shard_count"),
+            **cache_options
         )
 
+        self.add_ipc_handler("close", self.__on_ipc_close)
+        self.add_ipc_handler("access", self.__on_ipc_access)
+
+    def build_intents(self) -> Tuple[discord.Intents, discord.MemberCacheFlags]:
+        """Builds the smallest intents and member cache the installed modules declare"""
+        intents = discord.Intents.none()
+        member_cache_flags = discord.MemberCacheFlags.none()
+
+        intent_names = set(self.settings.get("memory_budget", {}).get("base_intents", ["guilds"]))
+        cache_names = set()
+
+        # Modules declare INTENTS and MEMBER_CACHE in their package
+        for module in self.modules:
+            package = importlib.import_module(module)
+            intent_names.update(getattr(package, "INTENTS", ()))
+            cache_names.update(getattr(package, "MEMBER_CACHE", ()))
+
+        for name in intent_names:
+            if name not in discord.Intents.VALID_FLAGS:
+                raise ValueError(f"Unknown intent: {name}")
+
+            setattr(intents, name, True)
+
+        for name in cache_names:
+            if name not in discord.MemberCacheFlags.VALID_FLAGS:
+                raise ValueError(f"Unknown member cache flag: {name}")
+
+            setattr(member_cache_flags, name, True)
+
+        self.logger.debug(f"Intents: {', '.join(sorted(intent_names))}; member cache: {', '.join(sorted(cache_names)) or 'none'}")
+
+        return intents, member_cache_flags
+
+    @property
+    def is_primary(self) -> bool:
+        """True in the one process that runs one-time jobs such as migrations"""
+        return self.cluster_id in (None, 0)
+
+    @property
+    def memory_report(self) -> Dict[str, int]:
+        """Returns resident memory now, before connecting and per guild"""
+        rss = rss_bytes()
+        guilds = len(self.guilds)
+
+        return {
+            "rss": rss,
+            "baseline": self.baseline_rss,
+            "guilds": guilds,
+            "per_guild": max(0, rss - self.baseline_rss) // guilds if guilds else 0
+        }
+
     def configure_logger(self) -> None:
         dictConfig(self.logging_config)
 
     def prefix(self, client: commands.Bot, message: discord.Message) -> str:
         return self.settings.get("prefix")
 
+    def add_ipc_handler(self, op: str, handler: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+        """Register a coroutine for messages sent by other clusters"""
+        self.__ipc_handlers[op] = handler
+
+    async def dispatch_ipc(self, message: Dict[str, Any]) -> None:
+        handler = self.__ipc_handlers.get(message.get("op"))
+
+        if not handler:
+            self.logger.debug(f"No handler for IPC op: {message.get('op')}")
+            return
+
+        try:
+            await handler(message)
+        except Exception as e:
+            self.logger.exception(f"IPC handler for {message.get('op')} failed: {e}")
+
+    async def __on_ipc_close(self, message: Dict[str, Any]) -> None:
+        # The launcher starts the cluster again once the process exits
+        await self.close()
+
+    async def __on_ipc_access(self, message: Dict[str, Any]) -> None:
+        if self.access:
+            self.access.invalidate(message.get("guild_id"))
+
+    @property
+    def http_session(self) -> aiohttp.ClientSession:
+        """Returns the pooled HTTP client shared by all cogs"""
+        if not self.__http_session or self.__http_session.closed:
+            raise RuntimeError("HTTP session is not available before setup_hook or after close")
+
+        return self.__http_session
+
+    def create_http_session(self) -> aiohttp.ClientSession:
+        """Create the pooled HTTP client from settings"""
+        http_settings = self.settings.get("http", {})
+
+        connector = aiohttp.TCPConnector(
+            limit=http_settings.get("limit", 100),
+            limit_per_host=http_settings.get("limit_per_host", 10),
+            keepalive_timeout=http_settings.get("keepalive_timeout", 30),
+            ttl_dns_cache=http_settings.get("ttl_dns_cache", 300),
+            use_dns_cache=True
+        )
+
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=http_settings.get("timeout", 15))
+        )
+
     async def setup_hook(self) -> None:
         folders = (
             "config", "data", "playlists", "logs"
@@ -47,12 +191,39 @@ class YaeMiko(commands.Bot):
             if not os.path.exists(f"./{folder}/"):
                 os.mkdir(f"./{folder}/")
 
+        self.__http_session = self.create_http_session()
+
+        database_settings = self.settings.get("database", {})
+        self.store = GuildStore(database_settings.get("path", "data/guilds.db"), database_settings.get("pool_size", 4))
+
+        # Clusters share the data folder, only one of them may move the old files
+        if database_settings.get("migrate", True) and self.is_primary:
+            await self.store.migrate("data")
+
+        self.access = AccessControl(self.store, database_settings.get("access_cache_guilds", 1024), self.ipc)
+
+        if self.ipc:
+            self.ipc.start(self.loop, self.dispatch_ipc)
+
+        # Everything allocated from here on is mostly gateway state
+        self.baseline_rss = rss_bytes()
+        self.logger.debug(f"Resident memory before connecting: {self.baseline_rss / 2 ** 20:.1f} MiB")
+
         for module in self.modules:
             await self.load_extension(module)
             self.logger.debug(f"{module} ready.")
 
     async def on_ready(self) -> None:
-        self.logger.debug(f"Connected to discord as {self.user}")
+        if self.cluster_id is not None:
+            self.logger.debug(f"Connected to discord as {self.user} (cluster {self.cluster_id}, shards {sorted(self.shards)})")
+        else:
+            self.logger.debug(f"Connected to discord as {self.user} ({self.shard_count} shards)")
+
+        report = self.memory_report
+        self.logger.info(
+            f"Resident memory: {report['rss'] / 2 ** 20:.1f} MiB for {report['guilds']} guilds "
+            f"(~{report['per_guild'] / 1024:.1f} KiB per guild over {report['baseline'] / 2 ** 20:.1f} MiB baseline)"
+        )
 
         await self.change_presence(
             activity = discord.Activity(
@@ -62,4 +233,13 @@ class YaeMiko(commands.Bot):
         )
 
     async def close(self) -> None:
-        await super().close()
\ No newline at end of file
+        await super().close()
+
+        await self.config.flush()
+
+        if self.store:
+            self.store.close()
+
+        if self.__http_session and not self.__http_session.closed:
+            await self.__http_session.close()
+            self.logger.debug("Closed HTTP session.")
@@ -0,0 +1,266 @@
+"""
+This file contains the cluster launcher which runs the bot as
+several processes, each owning a contiguous range of shards,
+and the IPC channel clusters use to reach each other.
+"""
+from multiprocessing import connection
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.request import Request, urlopen
+import asyncio
+import json
+import logging
+import multiprocessing
+import threading
+import time
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+
+def fetch_shard_count(token: str) -> int:
+    """Asks Discord how many shards the bot should run"""
+    request = Request(GATEWAY_URL, headers={"Authorization": f"Bot {token}"})
+
+    with urlopen(request) as response:
+        return json.load(response).get("shards", 1)
+
+def shard_ranges(shard_count: int, clusters: int) -> List[List[int]]:
+    """Splits shards into contiguous ranges, one per cluster"""
+    clusters = max(1, min(clusters, shard_count))
+    size, extra = divmod(shard_count, clusters)
+
+    ranges = []
+    start = 0
+
+    for i in range(clusters):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+
+    return ranges
+
+def run_cluster(cluster_id: int, shard_ids: List[int], shard_count: int, token: str, conn: connection.Connection, **kwargs) -> None:
+    """Entry point of a cluster process"""
+    # core.bot imports this module for ClusterIPC
+    from core.bot import YaeMiko
+
+    client = YaeMiko(
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+        cluster_id=cluster_id,
+        ipc=ClusterIPC(cluster_id, conn),
+        **kwargs
+    )
+    client.run(token, root_logger=True)
+
+class ClusterIPC:
+    """Cluster side of the pipe to the launcher"""
+    def __init__(self, cluster_id: int, conn: connection.Connection) -> None:
+        self.__cluster_id : int                   = cluster_id
+        self.__conn       : connection.Connection = conn
+        self.__lock       : threading.Lock        = threading.Lock()
+        self.__reader     : threading.Thread      = None
+        self.__logger     : logging.Logger        = logging.getLogger("yaemiko.cluster")
+
+    @property
+    def cluster_id(self) -> int:
+        return self.__cluster_id
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    def start(self, loop: asyncio.AbstractEventLoop, handler: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+        """Start delivering launcher messages to a coroutine on the event loop"""
+        def read() -> None:
+            while True:
+                try:
+                    message = self.__conn.recv()
+                except (EOFError, OSError):
+                    self.logger.debug("IPC channel to the launcher closed")
+                    return
+
+                asyncio.run_coroutine_threadsafe(handler(message), loop)
+
+        self.__reader = threading.Thread(target=read, name="cluster-ipc", daemon=True)
+        self.__reader.start()
+
+    def send(self, op: str, **payload) -> None:
+        """Send a request to the launcher"""
+        with self.__lock:
+            self.__conn.send({"op": op, "origin": self.cluster_id, **payload})
+
+    def broadcast(self, op: str, **payload) -> None:
+        """Deliver a message to every other cluster"""
+        self.send("broadcast", message={"op": op, "origin": self.cluster_id, **payload})
+
+    def restart(self, cluster_id: Optional[int] = None) -> None:
+        """Ask the launcher to restart one cluster, or all of them"""
+        self.send("restart", cluster=cluster_id)
+
+class ClusterLauncher:
+    """Runs and supervises the cluster processes"""
+    def __init__(
+        self,
+        token: str,
+        clusters: int,
+        shard_count: Optional[int] = None,
+        restart_delay: float = 5,
+        max_restart_delay: float = 300,
+        **kwargs
+    ) -> None:
+        self.__token             : str                              = token
+        self.__shard_count       : int                              = shard_count or fetch_shard_count(token)
+        self.__ranges            : List[List[int]]                  = shard_ranges(self.__shard_count, clusters)
+        self.__restart_delay     : float                            = restart_delay
+        self.__max_restart_delay : float                            = max_restart_delay
+        self.__kwargs            : Dict[str, Any]                   = kwargs
+        self.__context                                              = multiprocessing.get_context("spawn")
+        self.__processes         : Dict[int, multiprocessing.Process] = {}
+        self.__conns             : Dict[int, connection.Connection] = {}
+        self.__started_at        : Dict[int, float]                 = {}
+        self.__failures          : Dict[int, int]                   = {}
+        self.__restart_at        : Dict[int, float]                 = {}
+        self.__stopping          : bool                             = False
+        self.__logger            : logging.Logger                   = logging.getLogger("yaemiko.cluster")
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    def run(self) -> None:
+        """Start every cluster and supervise them until stopped"""
+        self.logger.info(f"Launching {len(self.__ranges)} clusters for {self.__shard_count} shards")
+
+        for cluster_id in range(len(self.__ranges)):
+            self.__start(cluster_id)
+
+        try:
+            while self.__processes or (self.__restart_at and not self.__stopping):
+                self.__supervise()
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self, timeout: float = 30) -> None:
+        """Close every cluster, terminating the ones that do not exit in time"""
+        self.__stopping = True
+        self.__restart_at.clear()
+
+        for cluster_id in list(self.__conns):
+            self.__send(cluster_id, {"op": "close"})
+
+        deadline = time.monotonic() + timeout
+
+        for cluster_id, process in list(self.__processes.items()):
+            process.join(max(0, deadline - time.monotonic()))
+
+            if process.is_alive():
+                self.logger.warning(f"Cluster {cluster_id} did not close in time, terminating")
+                process.terminate()
+                process.join()
+
+            self.__reap(cluster_id)
+
+    def __start(self, cluster_id: int) -> None:
+        parent, child = self.__context.Pipe()
+
+        process = self.__context.Process(
+            target=run_cluster,
+            name=f"cluster-{cluster_id}",
+            args=(cluster_id, self.__ranges[cluster_id], self.__shard_count, self.__token, child),
+            kwargs=self.__kwargs
+        )
+        process.start()
+        child.close()
+
+        self.__processes[cluster_id] = process
+        self.__conns[cluster_id] = parent
+        self.__started_at[cluster_id] = time.monotonic()
+
+        shards = self.__ranges[cluster_id]
+        self.logger.info(f"Started cluster {cluster_id} (shards {shards[0]}-{shards[-1]}, PID {process.pid})")
+
+    def __supervise(self) -> None:
+        """Wait for one round of messages, exits and due restarts"""
+        waitables = {conn: cluster_id for cluster_id, conn in self.__conns.items()}
+        sentinels = {process.sentinel: cluster_id for cluster_id, process in self.__processes.items()}
+
+        for ready in connection.wait([*waitables, *sentinels], timeout=1):
+            if ready in sentinels:
+                self.__on_exit(sentinels[ready])
+                continue
+
+            try:
+                message = ready.recv()
+            except (EOFError, OSError):
+                # The process is gone, its sentinel reports the exit
+                continue
+
+            self.__handle(waitables[ready], message)
+
+        now = time.monotonic()
+
+        for cluster_id, restart_at in list(self.__restart_at.items()):
+            if restart_at <= now and not self.__stopping:
+                del self.__restart_at[cluster_id]
+                self.__start(cluster_id)
+
+    def __on_exit(self, cluster_id: int) -> None:
+        process = self.__processes[cluster_id]
+        process.join()
+
+        uptime = time.monotonic() - self.__started_at[cluster_id]
+        self.__reap(cluster_id)
+
+        if self.__stopping:
+            return
+
+        # A cluster that stayed up for a while starts over with the base delay
+        if uptime > self.__max_restart_delay:
+            self.__failures[cluster_id] = 0
+
+        if cluster_id in self.__restart_at:
+            # Restart was requested, start again right away
+            delay = 0
+        else:
+            failures = self.__failures.get(cluster_id, 0)
+            delay = min(self.__max_restart_delay, self.__restart_delay * 2 ** failures)
+            self.__failures[cluster_id] = failures + 1
+
+        self.__restart_at[cluster_id] = time.monotonic() + delay
+        self.logger.warning(f"Cluster {cluster_id} exited with code {process.exitcode}, restarting in {delay:.0f}s")
+
+    def __reap(self, cluster_id: int) -> None:
+        self.__processes.pop(cluster_id, None)
+        conn = self.__conns.pop(cluster_id, None)
+
+        if conn:
+            conn.close()
+
+    def __handle(self, origin: int, message: Dict[str, Any]) -> None:
+        op = message.get("op")
+
+        if op == "broadcast":
+            for cluster_id in self.__conns:
+                if cluster_id != origin:
+                    self.__send(cluster_id, message.get("message"))
+
+        elif op == "restart":
+            target = message.get("cluster")
+            clusters = list(self.__conns) if target is None else [target]
+
+            for cluster_id in clusters:
+                if cluster_id not in self.__conns:
+                    continue
+
+                self.logger.info(f"Restarting cluster {cluster_id} on request of cluster {origin}")
+                # Marks the coming exit as requested so it skips the backoff
+                self.__restart_at[cluster_id] = float("inf")
+                self.__send(cluster_id, {"op": "close"})
+
+        else:
+            self.logger.debug(f"Unknown IPC op from cluster {origin}: {op}")
+
+    def __send(self, cluster_id: int, message: Dict[str, Any]) -> None:
+        try:
+            self.__conns[cluster_id].send(message)
+        except (BrokenPipeError, OSError) as e:
+            self.logger.debug(f"Failed to reach cluster {cluster_id}: {e}")
@@ -1,76 +1,195 @@
-"""NOTICE: THIS MODULE HAS BEEN DEPRECATED
+"""Guild settings config handler
 
-Guild settings config handler"""
+Values are parsed once and served from memory. The file is
+reloaded only when its mtime changes, and writes are coalesced
+into one atomic flush per interval.
+"""
+import asyncio
 import os
+import tempfile
+import time
 
 from configparser import ConfigParser
+from typing import Dict, Optional
 
 if not os.path.exists('config'):
     os.mkdir('config')
 
 class Config:
     """Config class"""
-    def __init__(self, config_path):
+    def __init__(self, config_path, check_interval=1.0, flush_interval=5.0):
         self.config_path = config_path
-        self.config = ConfigParser()
-        self.config.read(config_path)
+        self.check_interval = check_interval
+        self.flush_interval = flush_interval
+
+        self.__sections: Dict[str, Dict[str, str]] = {}
+        self.__mtime: Optional[float] = None
+        self.__checked_at: float = 0.0
+        self.__dirty: bool = False
+        self.__flush_handle: Optional[asyncio.TimerHandle] = None
+
+        self.__load()
+
+    def __load(self):
+        """Parses the file into memory"""
+        parser = ConfigParser(interpolation=None)
+
+        try:
+            self.__mtime = os.stat(self.config_path).st_mtime
+        except FileNotFoundError:
+            self.__mtime = None
+
+        parser.read(self.config_path, encoding="utf-8")
+        self.__sections = {section: dict(parser[section]) for section in parser.sections()}
+
+    def __refresh(self):
+        """Reloads the file if it changed on disk, at most once per check interval"""
+        now = time.monotonic()
+
+        if now - self.__checked_at < self.check_interval:
+            return
+
+        self.__checked_at = now
+
+        # Pending writes win over outside edits, they are flushed soon
+        if self.__dirty:
+            return
+
+        try:
+            mtime = os.stat(self.config_path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime != self.__mtime:
+            self.__load()
 
     def get(self, section, key, fallback=None):
         """Returns unformatted value from config"""
-        section, key = str(section), str(key)
-        self.config.read(self.config_path)
-        value = self.config.get(section, key, fallback=fallback)
-        return value
+        self.__refresh()
+        return self.__sections.get(str(section), {}).get(str(key).lower(), fallback)
 
     def getint(self, section, key, fallback=None):
         """Returns integer value from config"""
-        section, key = str(section), str(key)
-        self.config.read(self.config_path)
-        value = self.config.getint(section, key, fallback=fallback)
-        return value
+        value = self.get(section, key)
+        return fallback if value is None else int(value)
 
     def getboolean(self, section, key, fallback=None):
         """Returns boolean value from config"""
-        section, key = str(section), str(key)
-        self.config.read(self.config_path)
-        value = self.config.getboolean(section, key, fallback=fallback)
-        return value
+        value = self.get(section, key)
 
-    def set(self, section, key, value):
-        """Set config value to config"""
-        key = str(key)
-        value = str(value)
+        if value is None:
+            return fallback
 
-        self.config.read(self.config_path)
+        if value.lower() not in ConfigParser.BOOLEAN_STATES:
+            raise ValueError(f"Not a boolean: {value}")
 
-        if not section in self.config.sections():
-            self.config[section] = {}
+        return ConfigParser.BOOLEAN_STATES[value.lower()]
 
-        self.config[section][key] = value
-
-        with open(self.config_path, 'w', encoding="utf-8") as conf:
-            self.config.write(conf)
+    def set(self, section, key, value):
+        """Set config value to config"""
+        self.__refresh()
+        self.__sections.setdefault(str(section), {})[str(key).lower()] = str(value)
+        self.__mark_dirty()
 
     def delete(self, section, key):
         """Deletes a config value from config"""
-        key = str(key)
+        self.__refresh()
+        values = self.__sections.get(str(section))
+
+        if not values or values.pop(str(key).lower(), None) is None:
+            return
 
-        self.config.read(self.config_path)
+        self.__mark_dirty()
 
-        if not section in self.config.sections():
+    def has_section(self, section):
+        """Checks if a section exists in config"""
+        self.__refresh()
+        return str(section) in self.__sections
+
+    def __mark_dirty(self):
+        self.__dirty = True
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop to batch on, write through
+            self.flush()
             return
 
-        if not self.get(section, key):
+        if not self.__flush_handle:
+            self.__flush_handle = loop.call_later(self.flush_interval, self.__scheduled_flush, loop)
+
+    def __scheduled_flush(self, loop):
+        self.__flush_handle = None
+        loop.create_task(self.aflush())
+
+    def __snapshot(self):
+        parser = ConfigParser(interpolation=None)
+        parser.read_dict(self.__sections)
+        self.__dirty = False
+        return parser
+
+    def __write(self, parser):
+        """Writes to a temporary file and swaps it in, readers never see a partial file"""
+        folder = os.path.dirname(os.path.abspath(self.config_path))
+        fd, path = tempfile.mkstemp(dir=folder, prefix=".config-", suffix=".tmp")
+
+        try:
+            with os.fdopen(fd, 'w', encoding="utf-8") as conf:
+                parser.write(conf)
+
+            os.replace(path, self.config_path)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+        return os.stat(self.config_path).st_mtime
+
+    def flush(self):
+        """Writes pending changes now"""
+        if not self.__dirty:
             return
 
-        self.config[section].pop(key)
+        self.__mtime = self.__write(self.__snapshot())
 
-        with open(self.config_path, 'w', encoding="utf-8") as conf:
-            self.config.write(conf)
+    async def aflush(self):
+        """Writes pending changes without blocking the event loop"""
+        if self.__flush_handle:
+            self.__flush_handle.cancel()
+            self.__flush_handle = None
 
-    def has_section(self, section):
-        """Checks if a section exists in config"""
-        if section in self.config.sections():
-            return True
+        if not self.__dirty:
+            return
 
-        return False
+        # The snapshot is taken on the loop, only the file write runs in a thread
+        parser = self.__snapshot()
+        self.__mtime = await asyncio.get_running_loop().run_in_executor(None, self.__write, parser)
+
+class GuildConfigs:
+    """Lazily opened per guild configs, config/<guild id>.ini"""
+    def __init__(self, folder='config', check_interval=1.0, flush_interval=5.0):
+        self.folder = folder
+        self.check_interval = check_interval
+        self.flush_interval = flush_interval
+        self.__configs: Dict[int, Config] = {}
+
+    def __getitem__(self, guild_id) -> Config:
+        config = self.__configs.get(guild_id)
+
+        if not config:
+            config = Config(
+                os.path.join(self.folder, f"{guild_id}.ini"),
+                self.check_interval,
+                self.flush_interval
+            )
+            self.__configs[guild_id] = config
+
+        return config
+
+    def __len__(self):
+        return len(self.__configs)
+
+    async def flush(self):
+        """Writes every pending change"""
+        for config in list(self.__configs.values()):
+            await config.aflush()
@@ -0,0 +1,24 @@
+"""
+This file contains helpers for measuring the memory used by
+the bot process.
+"""
+import os
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def rss_bytes() -> int:
+    """Returns the resident set size of this process, 0 if unknown"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    if not resource:
+        return 0
+
+    # Peak rather than current usage, reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
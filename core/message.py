@@ -52,6 +52,10 @@ class Responses:
     bot_not_connected:           str = "Not connected to a **voice channel**."
     bot_on_connect:              str = "Connected to **[{vc_name}]** and bound to **[{channel_name}]**."
     music_empty_queue:           str =  "The queue is **empty**."
+    music_extractor_busy:        str = "Too many songs are being processed right now, please try again shortly."
+    music_invalid_position:      str = "There is no song at that **position** in the queue."
+    music_loop_mode:             str = "Loop mode set to **{mode}**."
+    music_node_full:             str = "The music player is at **full capacity** right now, please try again in a few minutes."
     music_no_pause:              str = "Cannot pause because nothing is playing."
     music_no_player:             str = "There is no **active player**."
     music_no_previous:           str = "Cannot play previous song."
@@ -64,5 +68,8 @@ class Responses:
     music_player_no_song:        str = "There is no **song** currently playing."
     music_player_volume:         str = "Player volume: **{volume}%**."
     music_player_volume_invalid: str = "The volume must be between **0** to **100**."
+    music_playlist_empty:        str = "That playlist has no playable tracks."
+    music_queue_moved:           str = "Moved **{title}** to position **{position}**."
+    music_queue_shuffled:        str = "The queue has been **shuffled**."
     music_wrong_channel:         str = "The player can only be controlled from **[{channel_name}]**."
     user_no_voice:               str = "You are not connected to a **voice channel**."
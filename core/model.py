@@ -1,42 +1,192 @@
+"""
+This file contains the guild storage layer. Every guild shares
+one sqlite database partitioned by guild ID, reached through a
+small pool of connections off the event loop.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import asyncio
+import glob
+import logging
+import os
+import queue
 import sqlite3
 
-class Database:
-    def __init__(self, guild_id) -> None:
-        # init database controller
-        path_to_db = f'./data/{guild_id}.db'
-        self.conn = sqlite3.connect(path_to_db)
-        self.c = self.conn.cursor()
-
-        # init database table
-        with self.conn:
-            self.c.execute("CREATE TABLE IF NOT EXISTS users (uid INTEGER, access INTEGER)")
-
-    def get_access(self, uid) -> int:
-        with self.conn:
-            self.c.execute("SELECT access FROM users WHERE uid=:uid", {"uid": uid})
-            access = self.c.fetchone()
-
-        if access:
-            return access[0]
-        else:
-            return 0
-
-    def compare_access(self, uid_a, uid_b) -> bool:
-        return uid_a if self.get_access(uid_a) > self.get_access(uid_b) else uid_b
-
-    def add_user(self, uid, access) -> None:
-        with self.conn:
-            self.c.execute("SELECT * FROM users WHERE uid=:uid", {"uid": uid})
-            data = self.c.fetchone()
-
-            if not data:
-                self.c.execute("INSERT INTO users VALUES (:uid, :access)", {"uid": uid, "access": access})
-
-    def delete_user(self, uid) -> None:
-        with self.conn:
-            self.c.execute("DELETE FROM users WHERE uid=:uid", {"uid": uid})
-
-    def update(self, uid, access) -> None:
-        self.add_user(uid, access)
-        with self.conn:
-            self.c.execute("UPDATE users SET access=:access WHERE uid=:uid", {"uid": uid, "access": access})
\ No newline at end of file
+class GuildStore:
+    def __init__(self, path: str = "data/guilds.db", pool_size: int = 4) -> None:
+        self.__path      : str                = path
+        self.__pool_size : int                = pool_size
+        self.__pool      : queue.LifoQueue    = queue.LifoQueue()
+        self.__conns     : List[sqlite3.Connection] = []
+        # One worker per connection, so a worker never waits for the pool
+        self.__executor  : ThreadPoolExecutor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="guildstore")
+        self.__logger    : logging.Logger     = logging.getLogger("yaemiko.store")
+
+        for _ in range(pool_size):
+            conn = self.__connect()
+            self.__conns.append(conn)
+            self.__pool.put(conn)
+
+        with self.__conns[0]:
+            self.__conns[0].execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "guild_id INTEGER NOT NULL, uid INTEGER NOT NULL, access INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (guild_id, uid)) WITHOUT ROWID"
+            )
+            self.__conns[0].execute(
+                "CREATE TABLE IF NOT EXISTS blocklist ("
+                "guild_id INTEGER NOT NULL, kind TEXT NOT NULL, pattern TEXT NOT NULL, "
+                "PRIMARY KEY (guild_id, kind, pattern)) WITHOUT ROWID"
+            )
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self.__logger
+
+    def __connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.__path, check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    async def run(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run a function with a pooled connection on a worker thread"""
+        def call() -> Any:
+            conn = self.__pool.get()
+            try:
+                return func(conn)
+            finally:
+                self.__pool.put(conn)
+
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, call)
+
+    async def get_access(self, guild_id: int, uid: int) -> int:
+        def query(conn: sqlite3.Connection) -> int:
+            row = conn.execute(
+                "SELECT access FROM users WHERE guild_id=? AND uid=?", (guild_id, uid)
+            ).fetchone()
+            return row[0] if row else 0
+
+        return await self.run(query)
+
+    async def get_guild_access(self, guild_id: int) -> Dict[int, int]:
+        """Returns every user of a guild with their access level, one range scan of the primary key"""
+        def query(conn: sqlite3.Connection) -> Dict[int, int]:
+            return dict(conn.execute(
+                "SELECT uid, access FROM users WHERE guild_id=? AND access != 0", (guild_id,)
+            ).fetchall())
+
+        return await self.run(query)
+
+    async def get_access_many(self, guild_id: int, uids: Iterable[int]) -> Dict[int, int]:
+        """Returns the access level of the given users that exist, in one query"""
+        uids = list(set(uids))
+
+        def query(conn: sqlite3.Connection) -> Dict[int, int]:
+            placeholders = ",".join("?" * len(uids))
+            return dict(conn.execute(
+                f"SELECT uid, access FROM users WHERE guild_id=? AND uid IN ({placeholders})", (guild_id, *uids)
+            ).fetchall())
+
+        if not uids:
+            return {}
+
+        return await self.run(query)
+
+    async def add_user(self, guild_id: int, uid: int, access: int) -> None:
+        """Add a user, keeping the access level of one that already exists"""
+        def query(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO users VALUES (?, ?, ?)", (guild_id, uid, access))
+
+        await self.run(query)
+
+    async def update(self, guild_id: int, uid: int, access: int) -> None:
+        def query(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.execute(
+                    "INSERT INTO users VALUES (?, ?, ?) "
+                    "ON CONFLICT (guild_id, uid) DO UPDATE SET access=excluded.access",
+                    (guild_id, uid, access)
+                )
+
+        await self.run(query)
+
+    async def delete_user(self, guild_id: int, uid: int) -> None:
+        def query(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.execute("DELETE FROM users WHERE guild_id=? AND uid=?", (guild_id, uid))
+
+        await self.run(query)
+
+    async def compare_access(self, guild_id: int, uid_a: int, uid_b: int) -> int:
+        """Returns the user with the higher access level, uid_b on ties"""
+        levels = await self.get_access_many(guild_id, (uid_a, uid_b))
+        return uid_a if levels.get(uid_a, 0) > levels.get(uid_b, 0) else uid_b
+
+    async def get_blocklist(self, guild_id: int) -> List[Tuple[str, str]]:
+        """Returns the (kind, pattern) pairs blocked in a guild"""
+        def query(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+            return conn.execute("SELECT kind, pattern FROM blocklist WHERE guild_id=?", (guild_id,)).fetchall()
+
+        return await self.run(query)
+
+    async def add_blocked(self, guild_id: int, kind: str, pattern: str) -> None:
+        def query(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO blocklist VALUES (?, ?, ?)", (guild_id, kind, pattern))
+
+        await self.run(query)
+
+    async def remove_blocked(self, guild_id: int, kind: str, pattern: str) -> None:
+        def query(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.execute(
+                    "DELETE FROM blocklist WHERE guild_id=? AND kind=? AND pattern=?", (guild_id, kind, pattern)
+                )
+
+        await self.run(query)
+
+    async def migrate(self, folder: str = "data") -> int:
+        """Imports the old data/<guild id>.db files once, returns the number of guilds imported"""
+        def query(conn: sqlite3.Connection) -> int:
+            imported = 0
+
+            for path in glob.glob(os.path.join(folder, "*.db")):
+                name = os.path.splitext(os.path.basename(path))[0]
+
+                if not name.isdigit():
+                    continue
+
+                source = sqlite3.connect(path)
+                try:
+                    rows = source.execute("SELECT uid, access FROM users").fetchall()
+                except sqlite3.OperationalError:
+                    rows = []
+                finally:
+                    source.close()
+
+                # Existing rows win, the old tables allowed duplicate uids
+                with conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO users VALUES (?, ?, ?)",
+                        [(int(name), uid, access) for uid, access in rows]
+                    )
+
+                os.replace(path, f"{path}.migrated")
+                imported += 1
+
+            return imported
+
+        imported = await self.run(query)
+
+        if imported:
+            self.logger.info(f"Migrated {imported} guild databases into {self.__path}")
+
+        return imported
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=True)
+
+        for conn in self.__conns:
+            conn.close()
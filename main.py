@@ -5,7 +5,10 @@ of the bot.
 import version
 import json
 
+from logging.config import dictConfig
+
 from core.bot import YaeMiko
+from core.cluster import ClusterLauncher
 from modules import INSTALLED_MODULES
 
 # Version information
@@ -23,5 +26,27 @@ if __name__ == "__main__":
     with open("secrets.json", 'r') as f:
         TOKEN = json.load(f).get("token")
 
-    client = YaeMiko(version=VERSION_INFO, modules=INSTALLED_MODULES)
-    client.run(TOKEN, root_logger=True)
+    with open("settings.json", 'r') as f:
+        CLUSTER_SETTINGS = json.load(f).get("cluster", {})
+
+    if CLUSTER_SETTINGS.get("clusters", 1) > 1:
+        with open("logging_config.json", 'r') as f:
+            dictConfig(json.load(f))
+
+        launcher = ClusterLauncher(
+            TOKEN,
+            CLUSTER_SETTINGS.get("clusters"),
+            shard_count=CLUSTER_SETTINGS.get("shard_count"),
+            restart_delay=CLUSTER_SETTINGS.get("restart_delay", 5),
+            max_restart_delay=CLUSTER_SETTINGS.get("max_restart_delay", 300),
+            version=VERSION_INFO,
+            modules=INSTALLED_MODULES
+        )
+        launcher.run()
+    else:
+        client = YaeMiko(
+            version=VERSION_INFO,
+            modules=INSTALLED_MODULES,
+            shard_count=CLUSTER_SETTINGS.get("shard_count")
+        )
+        client.run(TOKEN, root_logger=True)